@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+"""
+Aggregation of the sentiment of tweets for plots. Tweets are
+rolled up into time buckets, and raw tweets are downsampled with
+Largest Triangle Three Buckets (LTTB), which keeps the shape of
+the series and gives the same points for the same data every time.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Bucket sizes tried by choose_frequency, from the smallest.
+FREQUENCIES = ["15min", "1h", "3h", "6h", "12h", "1D", "7D", "30D"]
+
+
+def choose_frequency(dates, max_buckets=60):
+    """
+    Returns the smallest bucket size that splits the time span
+    of the tweets into at most max_buckets buckets.
+
+    :param dates: dates of the tweets
+    :type dates: Series
+    :param max_buckets: maximum number of buckets
+    :type max_buckets: int
+    :returns: frequency
+    :rtype: str
+    """
+    if dates.empty:
+        return FREQUENCIES[0]
+    span = dates.max() - dates.min()
+    for frequency in FREQUENCIES:
+        if span / pd.Timedelta(frequency) <= max_buckets:
+            return frequency
+    return FREQUENCIES[-1]
+
+
+def rollup_sentiment(df_tweets, frequency=None):
+    """
+    Rolls up the sentiment of tweets into time buckets with the
+    mean sentiment, the number of tweets and the share of negative
+    tweets of each bucket. Empty buckets are left out.
+
+    :param df_tweets: tweets with date and sentiment
+    :type df_tweets: DataFrame
+    :param frequency: size of the buckets, e.g. 1h, chosen from the
+        time span of the tweets by default
+    :type frequency: str
+    :returns: df_rollup, with date, mean, count and negative_share
+    :rtype: DataFrame
+    """
+    frequency = frequency or choose_frequency(df_tweets["date"])
+    sentiment = df_tweets.set_index("date")["sentiment"].astype("float64")
+    negative = (sentiment < 0).astype("float64")
+
+    df_rollup = pd.DataFrame({
+        "mean": sentiment.resample(frequency).mean(),
+        "count": sentiment.resample(frequency).count(),
+        "negative_share": negative.resample(frequency).mean(),
+    })
+    df_rollup = df_rollup[df_rollup["count"] > 0]
+    return df_rollup.rename_axis("date").reset_index()
+
+
+def lttb(x, y, threshold):
+    """
+    Selects threshold points of a series with Largest Triangle
+    Three Buckets. The first and last points are always kept.
+
+    :param x: values on the x axis, sorted
+    :type x: ndarray
+    :param y: values on the y axis
+    :type y: ndarray
+    :param threshold: number of points to keep
+    :type threshold: int
+    :returns: positions of the points kept
+    :rtype: ndarray
+    """
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return np.arange(length)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # buckets of the points between the first and the last one
+    edges = np.linspace(1, length - 1, threshold - 1).astype(np.int64)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_start = end
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else length
+        average_x = x[next_start:next_end].mean()
+        average_y = y[next_start:next_end].mean()
+
+        # twice the area of the triangles of the previous point, the
+        # candidate points and the average of the next bucket
+        areas = np.abs(
+            (x[previous] - average_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (average_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+def downsample(df_tweets, max_points):
+    """
+    Keeps at most max_points tweets, chosen with LTTB on the date
+    and sentiment of the tweets.
+
+    :param df_tweets: tweets with date and sentiment
+    :type df_tweets: DataFrame
+    :param max_points: maximum number of tweets
+    :type max_points: int
+    :returns: df_tweets, sorted by date
+    :rtype: DataFrame
+    """
+    df_tweets = df_tweets.sort_values("date", kind="mergesort")
+    positions = lttb(
+        df_tweets["date"].to_numpy(dtype="datetime64[ns]").astype(np.int64),
+        df_tweets["sentiment"].to_numpy(),
+        max_points,
+    )
+    return df_tweets.iloc[positions]
+
+
+def compare_handles(frames, frequency=None):
+    """
+    Aggregates the sentiment of several twitter handles in one pass.
+    The tweets of all the handles are concatenated with a handle
+    column and grouped by handle and by time bucket for the chart,
+    and by handle for the summary table.
+
+    :param frames: tweets by twitter handle
+    :type frames: dict
+    :param frequency: size of the buckets, chosen from the time span
+        of all the tweets by default
+    :type frequency: str
+    :returns: df_buckets, with handle, date, mean, count and
+        negative_share, and df_summary, one row per handle
+    :rtype: tuple
+    """
+    handles = list(frames)
+    df_all = pd.concat(
+        [frames[handle][["date", "sentiment"]] for handle in handles],
+        keys=handles,
+        names=["handle", None],
+    ).reset_index(level="handle")
+    df_all["handle"] = pd.Categorical(df_all["handle"], categories=handles)
+    df_all["negative"] = (df_all["sentiment"] < 0).astype("float64")
+    df_all["positive"] = (df_all["sentiment"] > 0).astype("float64")
+
+    frequency = frequency or choose_frequency(df_all["date"])
+    df_buckets = (
+        df_all.groupby(["handle", pd.Grouper(key="date", freq=frequency)], observed=True)
+        .agg(
+            mean=("sentiment", "mean"),
+            count=("sentiment", "count"),
+            negative_share=("negative", "mean"),
+        )
+        .reset_index()
+    )
+    df_buckets = df_buckets[df_buckets["count"] > 0]
+
+    df_summary = (
+        df_all.groupby("handle", observed=False)
+        .agg(
+            tweets=("sentiment", "count"),
+            mean=("sentiment", "mean"),
+            median=("sentiment", "median"),
+            negative_share=("negative", "mean"),
+            positive_share=("positive", "mean"),
+            latest=("date", "max"),
+        )
+        .reset_index()
+    )
+    return df_buckets, df_summary
@@ -0,0 +1,243 @@
+#!/usr/bin/python3
+"""
+JSON API for the classified tweets of twitter handles. Pages of
+tweets are selected with a cursor, the id of the last tweet of the
+previous page. Responses carry an ETag and Last-Modified derived
+from the version of the stored data, so clients polling the API
+get 304 Not Modified until the data changes.
+"""
+import hashlib
+import logging
+import math
+from datetime import datetime, timezone
+
+from flask import Blueprint, Response, jsonify, request
+
+from cx_storage import DERIVED_COLUMNS, TWEET_SCHEMA, add_derived_columns
+from cx_rate_limit import PAGE_VIEWS
+from cx_utility import RateLimitExceeded, TwitterUtility
+
+
+LOGGER = logging.getLogger("API")
+
+api_blueprint = Blueprint("api", __name__, url_prefix="/api")
+
+# Sentiment range of the classes of tweets shown on the display page.
+CLASSIFICATIONS = {
+    "contact_centre": (None, 0.0),
+    "bot": (0.0, None),
+}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+DEFAULT_TRIAGE_K = 20
+
+
+def error_response(message, status):
+    """
+    Returns an error as JSON.
+    """
+    response = jsonify({"error": message})
+    response.status_code = status
+    return response
+
+
+@api_blueprint.before_request
+def charge_page_view():
+    """
+    Takes every call of the API from the budget of page views, as
+    it reads the same data as the pages.
+    """
+    TwitterUtility.get_instance().acquire_rate_limit(PAGE_VIEWS)
+
+
+@api_blueprint.errorhandler(RateLimitExceeded)
+def too_many_requests(identifier):
+    """
+    Returns 429 Too Many Requests with a Retry-After header when a
+    rate limit budget is used up.
+    """
+    LOGGER.debug("Rate limit - %s", identifier)
+    response = error_response(str(identifier), 429)
+    response.headers["Retry-After"] = str(math.ceil(identifier.retry_after))
+    return response
+
+
+def conditional_response(handle):
+    """
+    Returns the ETag and Last-Modified of the data of a twitter
+    handle for the current request, and a 304 response if the
+    client already has this version.
+
+    :param handle: twitter handle
+    :type handle: str
+    :returns: etag, last_modified, not_modified response or None
+    :rtype: tuple
+    """
+    store = TwitterUtility.get_instance().store
+    version = store.version(handle)
+    etag = hashlib.sha1(
+        f"{store.name}:{handle}:{version}:{request.full_path}".encode("utf-8")
+    ).hexdigest()
+    last_modified = datetime.fromtimestamp(int(store.mtime(handle)), tz=timezone.utc)
+
+    not_modified = False
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    elif request.if_modified_since is not None:
+        not_modified = last_modified <= request.if_modified_since.replace(tzinfo=timezone.utc)
+
+    response = None
+    if not_modified:
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.last_modified = last_modified
+    return etag, last_modified, response
+
+
+def parse_float(name):
+    """
+    Reads an optional float parameter of the request.
+
+    :raises: :class:`ValueError`: The parameter is not a number.
+    """
+    value = request.args.get(name)
+    return None if value in (None, "") else float(value)
+
+
+@api_blueprint.route("/tweets/<handle>")
+def tweets(handle):
+    """
+    Returns a page of the tweets of a twitter handle, the latest first.
+
+    Parameters:
+    limit - number of tweets, up to 500
+    cursor - next_cursor of the previous page
+    columns - columns separated by commas, all by default
+    classification - contact_centre (negative) or bot (the others)
+    min_sentiment - lowest sentiment, included
+    max_sentiment - highest sentiment, excluded
+    """
+    cx_utility = TwitterUtility.get_instance()
+    if not cx_utility.has_data(handle):
+        return error_response(f"There is no data available for {handle}.", 404)
+
+    try:
+        limit = min(int(request.args.get("limit", DEFAULT_LIMIT)), MAX_LIMIT)
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor else None
+        min_sentiment = parse_float("min_sentiment")
+        max_sentiment = parse_float("max_sentiment")
+    except ValueError:
+        return error_response("limit, cursor and sentiments should be numbers.", 400)
+    if limit < 1:
+        return error_response("limit should be at least 1.", 400)
+
+    classification = request.args.get("classification")
+    if classification:
+        if classification not in CLASSIFICATIONS:
+            return error_response(
+                f"classification should be one of {', '.join(CLASSIFICATIONS)}.", 400
+            )
+        class_min, class_max = CLASSIFICATIONS[classification]
+        if class_min is not None:
+            min_sentiment = class_min if min_sentiment is None else max(min_sentiment, class_min)
+        if class_max is not None:
+            max_sentiment = class_max if max_sentiment is None else min(max_sentiment, class_max)
+
+    columns = request.args.get("columns")
+    columns = [column for column in columns.split(",") if column] if columns else list(TWEET_SCHEMA)
+    unknown = [
+        column for column in columns
+        if column not in TWEET_SCHEMA and column not in DERIVED_COLUMNS
+    ]
+    if unknown:
+        return error_response(f"Unknown columns {', '.join(unknown)}.", 400)
+    if "id" not in columns:
+        columns = ["id"] + columns
+
+    try:
+        etag, last_modified, not_modified = conditional_response(handle)
+        if not_modified is not None:
+            return not_modified
+        df_tweets = cx_utility.load_data(handle)
+    except (FileNotFoundError, ValueError):
+        return error_response(f"There is no data available for {handle}.", 404)
+
+    mask = df_tweets["id"].notna()
+    if cursor is not None:
+        mask &= df_tweets["id"] < cursor
+    if min_sentiment is not None:
+        mask &= df_tweets["sentiment"] >= min_sentiment
+    if max_sentiment is not None:
+        mask &= df_tweets["sentiment"] < max_sentiment
+
+    df_page = df_tweets[mask]
+    if not df_page["id"].is_monotonic_decreasing:
+        df_page = df_page.sort_values("id", ascending=False)
+    has_more = len(df_page) > limit
+    df_page = add_derived_columns(df_page.head(limit), columns)[columns]
+
+    if "date" in columns:
+        df_page = df_page.assign(date=df_page["date"].dt.strftime("%Y-%m-%dT%H:%M:%SZ"))
+    if "sentiment" in columns:
+        # float32 has about 7 significant digits
+        df_page = df_page.assign(sentiment=df_page["sentiment"].astype("float64").round(6))
+    # ids are strings, like id_str of the twitter API, as they do not fit in a double
+    df_page = df_page.assign(id=df_page["id"].astype(str))
+    records = df_page.astype(object).where(df_page.notna(), None).to_dict(orient="records")
+
+    response = jsonify({
+        "handle": handle,
+        "count": len(records),
+        "next_cursor": records[-1]["id"] if has_more else None,
+        "tweets": records,
+    })
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+@api_blueprint.route("/triage/<handle>")
+def triage(handle):
+    """
+    Returns the negative tweets of a twitter handle that a contact
+    centre should respond to first, the highest score first.
+
+    Parameters:
+    k - number of tweets, up to the capacity of the triage index
+    """
+    cx_utility = TwitterUtility.get_instance()
+    if not cx_utility.has_data(handle):
+        return error_response(f"There is no data available for {handle}.", 404)
+
+    try:
+        k = int(request.args.get("k", DEFAULT_TRIAGE_K))
+    except ValueError:
+        return error_response("k should be a number.", 400)
+    if k < 1:
+        return error_response("k should be at least 1.", 400)
+
+    try:
+        etag, last_modified, not_modified = conditional_response(handle)
+        if not_modified is not None:
+            return not_modified
+        records = cx_utility.get_triage(handle, k)
+    except (FileNotFoundError, ValueError):
+        return error_response(f"There is no data available for {handle}.", 404)
+
+    for record in records:
+        record["id"] = str(record["id"])
+        record["date"] = record["date"].strftime("%Y-%m-%dT%H:%M:%SZ")
+        record["sentiment"] = round(record["sentiment"], 6)
+
+    response = jsonify({
+        "handle": handle,
+        "count": len(records),
+        "tweets": records,
+    })
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+"""
+Manages the files of the tweets of twitter handles under data/.
+Files are written to a temporary file and renamed into place, so
+a page never reads a half written file. The directory is kept
+within a budget of bytes and files by removing the files that
+were not read for the longest time.
+"""
+import glob
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from environs import Env
+
+
+class DataCacheManager:
+    """
+    Atomic writes and least recently used eviction for the files
+    of a directory. The time a file was last read is kept in its
+    access time, so it is shared by all the processes. The
+    modification time is left as it is, as it tells how old the
+    data is.
+
+    :param path: directory of the files
+    :type path: str
+    :param extensions: extensions of the files managed
+    :type extensions: list
+    :param reserved: names of files that are never removed
+    :type reserved: set
+    """
+
+    def __init__(self, path="data/", extensions=(".csv",), reserved=()):
+        env = Env()
+        env.read_env()
+        # zero means there is no limit
+        self.max_bytes = int(env.float("DATA_CACHE_MAX_MB", 0) * 1024 * 1024)
+        self.max_files = env.int("DATA_CACHE_MAX_FILES", 0)
+        self.sweep_seconds = env.float("DATA_CACHE_SWEEP_SECONDS", 300)
+
+        self.path = path
+        self.extensions = tuple(extensions)
+        self.reserved = set(reserved)
+        self.lock = threading.Lock()
+        self.last_sweep = 0
+        self.evictions = 0
+        self.logger = logging.getLogger("DataCacheManager")
+
+    @contextmanager
+    def atomic_file(self, file):
+        """
+        Gives the name of a temporary file to write to, which is
+        renamed to the file once the writing is finished. The
+        temporary file is removed if the writing fails.
+
+        :param file: name of the file
+        :type file: str
+        """
+        directory, name = os.path.split(file)
+        temp_file = os.path.join(
+            directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        try:
+            yield temp_file
+            os.replace(temp_file, file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+        self.maybe_sweep(protect=file)
+
+    def record_access(self, file):
+        """
+        Sets the access time of a file to now, keeping its
+        modification time. The file is opened and its times are
+        read and set through the descriptor, so a file written at
+        the same time by atomic_file keeps its own modification
+        time, instead of the time of the file it replaced.
+
+        :param file: name of the file
+        :type file: str
+        """
+        if os.utime not in os.supports_fd:  # e.g. on Windows
+            return
+        try:
+            descriptor = os.open(file, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            stat = os.fstat(descriptor)
+            os.utime(descriptor, ns=(time.time_ns(), stat.st_mtime_ns))
+        finally:
+            os.close(descriptor)
+
+    def maybe_sweep(self, protect=None):
+        """
+        Sweeps the directory if the last sweep is older than
+        DATA_CACHE_SWEEP_SECONDS.
+
+        :param protect: a file that must not be removed
+        :type protect: str
+        """
+        if not self.max_bytes and not self.max_files:
+            return
+        with self.lock:
+            if time.monotonic() - self.last_sweep < self.sweep_seconds:
+                return
+            self.last_sweep = time.monotonic()
+        self.sweep(protect)
+
+    def files(self):
+        """
+        Returns the access time, size and name of the managed files,
+        the least recently read first.
+        """
+        entries = []
+        for extension in self.extensions:
+            for file in glob.glob(os.path.join(self.path, "*" + extension)):
+                name = os.path.basename(file)[: -len(extension)]
+                if name in self.reserved:
+                    continue
+                try:
+                    stat = os.stat(file)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, file))
+        return sorted(entries)
+
+    def sweep(self, protect=None):
+        """
+        Removes the least recently read files until the directory is
+        within DATA_CACHE_MAX_MB and DATA_CACHE_MAX_FILES.
+
+        :param protect: a file that must not be removed
+        :type protect: str
+        :returns: removed files
+        :rtype: list
+        """
+        entries = self.files()
+        total_bytes = sum(size for _, size, _ in entries)
+        total_files = len(entries)
+        removed = []
+
+        for _, size, file in entries:
+            over_bytes = self.max_bytes and total_bytes > self.max_bytes
+            over_files = self.max_files and total_files > self.max_files
+            if not over_bytes and not over_files:
+                break
+            if file == protect:
+                continue
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            total_files -= 1
+            removed.append(file)
+
+        if removed:
+            with self.lock:
+                self.evictions += len(removed)
+            self.logger.info("Removed %d files from %s.", len(removed), self.path)
+        return removed
+
+    def stats(self):
+        """
+        Returns the usage of the directory.
+
+        :returns: stats
+        :rtype: dict
+        """
+        entries = self.files()
+        return {
+            "files": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "evictions": self.evictions,
+        }
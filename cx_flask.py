@@ -10,34 +10,39 @@ sentiment with a competitor using interactive
 visualisation library. This is a POC. Tweets can be
 filtered and categorised further.
 """
+import cProfile
+import io
+import math
 import os
+import pstats
 import re
+import sys
+import time
 
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from environs import Env
 
 
-from flask import Flask, render_template, url_for, redirect
-
-
-import pandas as pd
-
-
-from bokeh.embed import components
-from bokeh.plotting import figure
-from bokeh.resources import INLINE
-from bokeh.util.string import encode_utf8
-from bokeh.models import ColumnDataSource
-from bokeh.models.tools import HoverTool
+from flask import Flask, render_template, url_for, redirect, abort, send_from_directory
+from flask import Blueprint, Response, current_app, g, make_response, request
+from flask import stream_with_context
 
 from cx_form_handler import TwitterAPI
 
 from cx_utility import TwitterUtility
-from cx_utility import CustomerExperienceException
+from cx_utility import CustomerExperienceException, RateLimitExceeded
+from cx_rate_limit import PAGE_VIEWS
+
+from cx_refresh import BackgroundRefresher
+from cx_storage import DERIVED_COLUMNS, add_derived_columns
+from cx_sentiment_engine import score_chunk
 
+from cx_api import api_blueprint
 
+from cx_metrics import REGISTRY, REQUEST_SECONDS, REQUESTS
 
-from cx_flask_form import TwitterHandleForm
+from cx_flask_form import TwitterHandleForm, CompareHandlesForm
 
 
 
@@ -54,12 +59,243 @@ logging.info("POC - Twitter API - Flask App")
 
 LOGGER = logging.getLogger("CustomerXP")
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = "customerxp"
+# Columns of the tweets shown in the tables of the display page.
+TABLE_COLUMNS = ["tweets", "id", "len", "source", "likes", "sentiment"]
+
+# The pages of the app, registered on the app by create_app.
+views = Blueprint("views", __name__)
+
+ENV = Env()
+ENV.read_env()
+
+# Threads used to validate and fetch the twitter handles of a
+# request at the same time, instead of one after the other.
+HANDLE_EXECUTOR = ThreadPoolExecutor(max_workers=ENV.int("HANDLE_WORKERS", 4))
+
+# The display page is streamed, so the header and the plot are sent
+# before the tweet tables, which are rendered a chunk of rows at a time.
+DISPLAY_STREAM = ENV.bool("DISPLAY_STREAM", True)
+STREAM_CHUNK_ROWS = ENV.int("STREAM_CHUNK_ROWS", 100)
+
+# Number of negative tweets shown first on the display page, see cx_triage.
+TRIAGE_TOP_K = ENV.int("TRIAGE_TOP_K", 20)
 
+# Any page can be profiled with ?profile=1 when it is turned on.
+METRICS_PROFILING = ENV.bool("METRICS_PROFILING", False)
+
+
+def iter_table_rows(df_tweets, columns=TABLE_COLUMNS, chunk_rows=None):
+    """
+    Returns the rows of a dataframe as tuples, converting a chunk
+    of rows at a time instead of the whole dataframe at once.
+    Derived columns, like the length of the tweets, are computed
+    for the chunk. The columns are checked before the first row,
+    so a frame that can not be shown fails before a page is streamed.
+
+    :param df_tweets: tweets
+    :type df_tweets: pandas.DataFrame
+    :param columns: columns of each row
+    :type columns: list
+    :param chunk_rows: number of rows converted at a time,
+        STREAM_CHUNK_ROWS by default
+    :type chunk_rows: int
+    :returns: rows of the dataframe
+    :rtype: generator
+
+    :raises: :class:`ValueError`: A column is missing.
+    """
+    chunk_rows = chunk_rows or STREAM_CHUNK_ROWS
+    missing = [
+        column for column in columns
+        if column not in df_tweets and column not in DERIVED_COLUMNS
+    ]
+    if missing:
+        raise ValueError(f"The tweets have no {', '.join(missing)} column.")
+
+    def rows():
+        for start in range(0, len(df_tweets), chunk_rows):
+            # the page streamed so far is sent before the next chunk
+            g.stream_flush = True
+            chunk = add_derived_columns(df_tweets.iloc[start:start + chunk_rows], columns)
+            # the values keep their compact types, e.g. float32 sentiment
+            yield from zip(*(chunk[column].to_numpy() for column in columns))
+
+    return rows()
+
+
+def flush_by_rows(events):
+    """
+    Joins the pieces of markup of a template into the chunks sent
+    to the client. The markup is sent when iter_table_rows starts a
+    chunk of rows, so the page up to the first table, with the plot,
+    is sent first and then a chunk of rows at a time.
+
+    :param events: pieces of markup of the template
+    :type events: iterable
+    :returns: chunks of the page
+    :rtype: generator
+    """
+    buffer = []
+    g.stream_flush = False
+    for event in events:
+        if g.stream_flush:
+            g.stream_flush = False
+            if buffer:
+                yield "".join(buffer)
+                buffer = []
+        buffer.append(event)
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_template(template_name, **context):
+    """
+    Renders a template as a streamed response, sent a chunk of
+    table rows at a time, see flush_by_rows.
+
+    :param template_name: name of the template
+    :type template_name: str
+    :param context: variables of the template
+    :type context: dict
+    :returns: streamed response
+    :rtype: flask.Response
+    """
+    current_app.update_template_context(context)
+    template = current_app.jinja_env.get_template(template_name)
+    return Response(
+        stream_with_context(flush_by_rows(template.generate(context))), mimetype="text/html"
+    )
 
-@app.route("/", methods=["GET", "POST"])
-@app.route("/customerxp", methods=["GET", "POST"])
+
+def rate_limited(html, identifier):
+    """
+    Returns a page with 429 Too Many Requests and a Retry-After
+    header telling the client when to try again.
+
+    :param html: page to return
+    :type html: str
+    :param identifier: the exception raised by the rate limiter
+    :type identifier: RateLimitExceeded
+    :returns: response
+    :rtype: flask.Response
+    """
+    response = make_response(html, 429)
+    response.headers["Retry-After"] = str(math.ceil(identifier.retry_after))
+    return response
+
+
+@views.app_errorhandler(RateLimitExceeded)
+def too_many_requests(identifier):
+    """
+    Displays an error page when a rate limit budget is used up.
+    """
+    LOGGER.debug("Rate limit - %s", identifier)
+    return rate_limited(render_template("error.html", error=str(identifier)), identifier)
+
+
+def refresh_handle(handle):
+    """
+    Fetches the latest tweets of a twitter handle, unless
+    the data was refreshed since the refresh was requested.
+
+    :param handle: twitter handle
+    :type handle: str
+    """
+    if TwitterUtility.get_instance().is_data_in_cache(handle) is False:
+        TwitterAPI.get_instance().get_tweets(handle)
+
+
+# Refreshes out of date data in the background while the old
+# data is served.
+REFRESHER = BackgroundRefresher(
+    refresh_handle,
+    workers=ENV.int("REFRESH_WORKERS", 2),
+    key=lambda handle: TwitterUtility.get_instance().store.key(handle),
+)
+
+
+def validate_handle(cx_utility, api, handle):
+    """
+    Validates a twitter handle, with the API if it is not in
+    the local lists.
+
+    :param cx_utility: utility used for the local lists
+    :type cx_utility: TwitterUtility
+    :param api: twitter client
+    :type api: TwitterAPI
+    :param handle: twitter handle
+    :type handle: str
+    :returns: valid
+    :rtype: bool
+
+    :raises: :class:`CustomerExperienceException`: Connection to API fails.
+    """
+    user_valid = cx_utility.lookup_user(handle)
+    if user_valid is None:
+        user_valid = api.is_user_valid(handle)
+    return user_valid
+
+
+def fetch_handle(cx_utility, api, handle):
+    """
+    Fetches the tweets of a valid twitter handle, if they are not
+    in the cache. Data that is out of date, but not too old, is
+    refreshed in the background instead.
+
+    :param cx_utility: utility used for the cache
+    :type cx_utility: TwitterUtility
+    :param api: twitter client
+    :type api: TwitterAPI
+    :param handle: twitter handle
+    :type handle: str
+    """
+    if cx_utility.is_data_in_cache(handle) is False:
+        if cx_utility.is_stale_data_usable(handle):
+            REFRESHER.schedule(handle)
+        else:
+            api.get_tweets(handle)
+
+
+def prepare_handles(cx_utility, api, handles):
+    """
+    Validates all the twitter handles at the same time and then
+    fetches their tweets at the same time. Nothing is fetched if
+    one of the handles is invalid, so a request that ends with an
+    error does not use the budget of the API. The results are
+    checked in the order of the handles, so the first invalid
+    handle or the first error is reported.
+
+    :param cx_utility: utility used for the local lists and cache
+    :type cx_utility: TwitterUtility
+    :param api: twitter client
+    :type api: TwitterAPI
+    :param handles: twitter handles
+    :type handles: list
+    :returns: invalid_handle, None if all the handles are valid
+    :rtype: str
+
+    :raises: :class:`CustomerExperienceException`: Connection to API fails.
+    """
+    futures = [
+        HANDLE_EXECUTOR.submit(validate_handle, cx_utility, api, handle)
+        for handle in handles
+    ]
+    for handle, future in zip(handles, futures):
+        if future.result() is False:
+            return handle
+
+    futures = [
+        HANDLE_EXECUTOR.submit(fetch_handle, cx_utility, api, handle)
+        for handle in handles
+    ]
+    for future in futures:
+        future.result()
+
+    return None
+
+
+@views.route("/", methods=["GET", "POST"])
+@views.route("/customerxp", methods=["GET", "POST"])
 def customerxp():
     """
     Returns a form to enter twitter handle and competitors
@@ -80,12 +316,7 @@ def customerxp():
     form.twitter_handle_error.data = " "
 
     cx_utility = TwitterUtility.get_instance()
-    api = TwitterAPI()
-
-    env = Env()
-    env.read_env()
-
-    
+    api = TwitterAPI.get_instance()
 
     if form.is_submitted():
 
@@ -96,20 +327,6 @@ def customerxp():
                 unnecessary characters."
             return render_template("customerxp.html", form=form)
 
-        cx_utility.set_user_search_count()
-        LOGGER.debug(
-            f"User search count : {cx_utility.get_user_search_count()}"
-            )
-        # Keep track of count of user searches.
-        # A low count as it is just a POC and not
-        # expecting a large number of calls. It can
-        # be combined with time window, if the exact
-        # rate limit of API is known.
-        if cx_utility.get_user_search_count() > 50:
-            form.twitter_handle_error.data = f"Too many user searches\
-                - {cx_utility.get_user_search_count()}"
-            return render_template("customerxp.html", form=form)    
-
         user_handle = " ".join(
             re.sub(os.getenv("USER_CLEAN_REGEX"),
             " ", str(form.twitter_handle.data),).split()
@@ -120,34 +337,27 @@ def customerxp():
             )
                 
         try:
-            if cx_utility.validate_user_in_list(user_handle) is False:
-                if api.is_user_valid(user_handle) is False:
-                    form.twitter_handle_error.data = (
-                        f"Twitter handle {user_handle} is not valid!"
-                        )
-                    return render_template("customerxp.html", form=form)
-
-            if cx_utility.validate_user_in_list(competitor_handle) is False:
-                if api.is_user_valid(competitor_handle) is False:
-                    form.twitter_handle_error.data = (
-                                f"Twitter handle {competitor_handle} is not valid!"
-                            )
-                    return render_template("customerxp.html", form=form)
-
-            if cx_utility.is_data_in_cache(user_handle) is False:
-                api.get_tweets(user_handle)
-
-            if cx_utility.is_data_in_cache(competitor_handle) is False:
-                api.get_tweets(competitor_handle)
+            invalid_handle = prepare_handles(
+                cx_utility, api, [user_handle, competitor_handle]
+            )
+            if invalid_handle is not None:
+                form.twitter_handle_error.data = (
+                    f"Twitter handle {invalid_handle} is not valid!"
+                    )
+                return render_template("customerxp.html", form=form)
 
             return redirect(
                 url_for(
-                        "display",
+                        ".display",
                         user_handle=user_handle,
                         competitor_handle=competitor_handle,
                     )
             )
 
+        except RateLimitExceeded as identifier:
+            form.twitter_handle_error.data = str(identifier)
+            return rate_limited(render_template("customerxp.html", form=form), identifier)
+
         except CustomerExperienceException as identifier:
             form.twitter_handle_error.data = f"Fatal Error -\
                 Please contact System Administrator - {identifier}"
@@ -155,7 +365,7 @@ def customerxp():
     return render_template("customerxp.html", form=form)
 
 
-@app.route("/display/<user_handle>/<competitor_handle>")
+@views.route("/display/<user_handle>/<competitor_handle>")
 def display(user_handle, competitor_handle):
     """
     A function used to display data. If the twitter
@@ -168,107 +378,54 @@ def display(user_handle, competitor_handle):
             user_handle, competitor_handle
     )
     error = " "
-    path = "data/"
-    file_extension = ".csv"
-    # Modification and validation required
-    file_user = path + user_handle + file_extension
-    file_competitor = path + competitor_handle + file_extension
-
-    file_user_exists = os.path.isfile(file_user)
-    file_competitor_exists = os.path.isfile(file_competitor)
 
     cx_utility = TwitterUtility.get_instance()
-    cx_utility.set_data_search_count()
-
-    # Keep track of count of user searches. A low count as it
-    # is just a POC and not expecting a large number of calls.
-    # It can be combined with time window, if the exact rate
-    # limit of API is known.
-    if cx_utility.get_data_search_count() > 50:
-        error = f"Too many data fetches - {cx_utility.get_data_search_count()}"
-        return render_template("error.html", error=error)
+    # The budget of page views is shared by all the processes of the app.
+    cx_utility.acquire_rate_limit(PAGE_VIEWS)
+
+    if cx_utility.has_data(user_handle) and cx_utility.has_data(competitor_handle):
+        # serve the files as they are and refresh them if they are out of date
+        for handle in (user_handle, competitor_handle):
+            if cx_utility.is_stale_data_usable(handle):
+                REFRESHER.schedule(handle)
 
-    if file_user_exists and file_competitor_exists:
         try:
-            df_user = pd.read_csv(file_user, index_col=4, parse_dates=["date"])
-            df_competitor = pd.read_csv(file_competitor, index_col=4, parse_dates=["date"])
+            df_user = cx_utility.load_data(user_handle)
 
             df_user_contact_centre = df_user[(df_user["sentiment"] < 0)]
 
             df_user_bot = df_user[(df_user["sentiment"] >= 0)]
 
-            tweets_bot = [df_user.columns.values.tolist()] + df_user_bot.values.tolist()
-            tweets_contact_centre = [
-                df_user.columns.values.tolist()
-            ] + df_user_contact_centre.values.tolist()
-
-            sample_user = df_user.sample(25)
-            source_user = ColumnDataSource(sample_user)
-
-            sample_competitor = df_competitor.sample(25)
-            source_competitor = ColumnDataSource(sample_competitor)
-
-            fig = figure(plot_width=700, plot_height=400, x_axis_type="datetime")
-
-            fig.circle(
-                x="date",
-                y="sentiment",
-                source=source_user,
-                size=10,
-                color="green",
-                legend=user_handle,
-            )
-
-            fig.circle(
-                x="date",
-                y="sentiment",
-                source=source_competitor,
-                size=10,
-                color="red",
-                legend=competitor_handle,
-            )
-
-            fig.title.text = "Customer Experience"
-            fig.xaxis.axis_label = "Time Window"
-            fig.yaxis.axis_label = "Sentiment"
-
-            fig.legend.location = "top_left"
-            fig.legend.click_policy = "hide"
-
-            hover = HoverTool()
-            hover.point_policy = "snap_to_data"
-            hover.line_policy = "none"
-
-            hover.tooltips = """
-            <div>
-                <div width: 100px word-wrap: break-word>
-                    <span style="font-size: 10px;">@tweets</span>
-                </div>
-            </div>
-            """
-
-            fig.add_tools(hover)
-
             # grab the static resources
-            js_resources = INLINE.render_js()
-            css_resources = INLINE.render_css()
-
-            # render template
-            script, div = components(fig)
-            html = render_template(
-                "cust_support_competition.html",
+            cx_plot = plotting()
+            resources = cx_plot.get_resources()
+            js_resources = resources.render_js()
+            css_resources = resources.render_css()
+
+            # render template, everything that reads the data is done
+            # here, so a failure shows the error page and not half a page
+            script, div = cx_plot.render_comparison(cx_utility, user_handle, competitor_handle)
+            context = dict(
                 plot_script=script,
                 plot_div=div,
                 js_resources=js_resources,
                 css_resources=css_resources,
-                tweets_bot=tweets_bot,
-                tweets_contact_centre=tweets_contact_centre,
+                table_header=TABLE_COLUMNS,
+                triage=cx_utility.get_triage(user_handle, TRIAGE_TOP_K),
+                tweets_bot=iter_table_rows(df_user_bot),
+                tweets_contact_centre=iter_table_rows(df_user_contact_centre),
                 user_handle=user_handle,
                 competitor_handle=competitor_handle,
             )
-            return encode_utf8(html)
+            # a profiled page is rendered in full, so the profile
+            # covers the template and not only the start of the stream
+            stream = request.args.get("stream", type=int, default=int(DISPLAY_STREAM))
+            if stream and g.get("profiler") is None:
+                return stream_template("cust_support_competition.html", **context)
+
+            return render_template("cust_support_competition.html", **context)
 
-        except ValueError as error:
+        except (FileNotFoundError, ValueError) as error:
             error = "There is no data available for one of the twitter handles. Please check data and try again."
             return render_template("error.html", error=error)
 
@@ -278,6 +435,253 @@ def display(user_handle, competitor_handle):
         return render_template("error.html", error=error)
 
 
+@views.route("/compare", methods=["GET", "POST"])
+def compare():
+    """
+    Returns a form to enter a number of twitter handles to
+    compare. After the form is submitted, the handles are
+    validated and their data is fetched at the same time, and
+    the comparison is displayed.
+    """
+    form = CompareHandlesForm()
+    form.twitter_handle_error.data = " "
+
+    if form.is_submitted():
+
+        if form.validate() is False:
+            form.twitter_handle_error.data = " ".join(form.twitter_handles.errors)
+            return render_template("compare_form.html", form=form)
+
+        handles = [
+            " ".join(re.sub(os.getenv("USER_CLEAN_REGEX"), " ", handle).split())
+            for handle in form.get_handles()
+        ]
+
+        try:
+            invalid_handle = prepare_handles(
+                TwitterUtility.get_instance(), TwitterAPI.get_instance(), handles
+            )
+            if invalid_handle is not None:
+                form.twitter_handle_error.data = (
+                    f"Twitter handle {invalid_handle} is not valid!"
+                    )
+                return render_template("compare_form.html", form=form)
+
+            return redirect(url_for(".display_handles", handles=",".join(handles)))
+
+        except RateLimitExceeded as identifier:
+            form.twitter_handle_error.data = str(identifier)
+            return rate_limited(render_template("compare_form.html", form=form), identifier)
+
+        except CustomerExperienceException as identifier:
+            form.twitter_handle_error.data = f"Fatal Error -\
+                Please contact System Administrator - {identifier}"
+
+    return render_template("compare_form.html", form=form)
+
+
+@views.route("/compare/<handles>")
+def display_handles(handles):
+    """
+    Displays a plot of the sentiment of a number of twitter
+    handles over time, and a summary table with a row per handle.
+    The data of the handles is read at the same time.
+    """
+    handles = [handle for handle in handles.split(",") if handle]
+    LOGGER.debug("In display handles method handles %s", handles)
+
+    cx_utility = TwitterUtility.get_instance()
+    cx_utility.acquire_rate_limit(PAGE_VIEWS)
+
+    missing = [handle for handle in handles if not cx_utility.has_data(handle)]
+    if not handles or missing:
+        error = f"There is no data available for {', '.join(missing) or 'the twitter handles'}.\
+        Please visit the compare page and try again."
+        return render_template("error.html", error=error)
+
+    for handle in handles:
+        if cx_utility.is_stale_data_usable(handle):
+            REFRESHER.schedule(handle)
+
+    try:
+        cx_plot = plotting()
+        script, div, df_summary = cx_plot.render_handles(
+            cx_utility,
+            handles,
+            lambda: dict(zip(handles, HANDLE_EXECUTOR.map(cx_utility.load_data, handles))),
+        )
+        resources = cx_plot.get_resources()
+        return render_template(
+            "compare.html",
+            plot_script=script,
+            plot_div=div,
+            js_resources=resources.render_js(),
+            css_resources=resources.render_css(),
+            summary=df_summary.itertuples(index=False),
+            handles=handles,
+        )
+
+    except (FileNotFoundError, ValueError):
+        error = "There is no data available for one of the twitter handles. Please check data and try again."
+        return render_template("error.html", error=error)
+
+
+@views.route("/bokeh/<version>/static/<path:filename>")
+def bokeh_static(version, filename):
+    """
+    Serves the BokehJS files of the installed bokeh. The version
+    of bokeh is part of the url, so the files can be cached by
+    browsers for a year.
+    """
+    cx_plot = plotting()
+    if version != cx_plot.BOKEH_VERSION:
+        abort(404)
+    response = send_from_directory(cx_plot.bokeh_static_dir(), filename)
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    return response
+
+
+@views.route("/status")
+def status():
+    """
+    Displays the refreshes of twitter handles that are pending
+    and the last ones that finished, and the rate limit budgets.
+    """
+    pending, finished = REFRESHER.status()
+    rate_limits = TwitterUtility.get_instance().rate_limiter.status()
+    return render_template(
+        "status.html", pending=pending, finished=finished, rate_limits=rate_limits
+    )
+
+
+@views.route("/metrics")
+def metrics():
+    """
+    Returns the timers and counters of this process in the
+    Prometheus text format.
+    """
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+def cache_metrics():
+    """
+    Returns the counters of the caches of this process for /metrics.
+
+    :returns: (name, kind, documentation, [(labels, value)])
+    :rtype: list
+    """
+    cx_utility = TwitterUtility.get_instance()
+    caches = {
+        "sentiment": cx_utility.sentiment_cache.stats(),
+        "frame": cx_utility.frame_cache.stats(),
+    }
+    # the plots are only counted once bokeh is imported
+    if "cx_plot" in sys.modules:
+        caches["render"] = sys.modules["cx_plot"].RENDER_CACHE.stats()
+
+    hits = [({"cache": name}, stats["hits"] + stats.get("disk_hits", 0))
+            for name, stats in caches.items()]
+    misses = [({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+    ratios = [
+        (labels, hit / (hit + miss) if hit + miss else 0.0)
+        for (labels, hit), (_, miss) in zip(hits, misses)
+    ]
+    return [
+        ("cx_cache_hits_total", "counter", "Hits of the caches.", hits),
+        ("cx_cache_misses_total", "counter", "Misses of the caches.", misses),
+        ("cx_cache_hit_ratio", "gauge", "Share of hits of the caches.", ratios),
+    ]
+
+
+REGISTRY.register_collector(cache_metrics)
+
+
+def start_request():
+    """
+    Starts the timer of a request, and its profiler if ?profile=1
+    is given and METRICS_PROFILING is turned on.
+    """
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if METRICS_PROFILING and request.args.get("profile"):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def finish_request(response):
+    """
+    Records the time and status of a request. A profiled request
+    returns the functions that took the most time instead of the page.
+    Streamed pages are timed up to the first byte.
+    """
+    endpoint = request.endpoint or "unknown"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.get("request_start", time.perf_counter()),
+                            endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+
+    profiler = g.get("profiler")
+    if profiler is not None:
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(40)
+        return Response(output.getvalue(), mimetype="text/plain")
+    return response
+
+
+def plotting():
+    """
+    Returns the plotting module. Bokeh is only imported when the
+    first page with a plot is displayed, unless it is preloaded.
+
+    :returns: cx_plot
+    :rtype: module
+    """
+    import cx_plot
+
+    return cx_plot
+
+
+def preload():
+    """
+    Imports the heavy modules, bokeh and the sentiment backend,
+    and loads their data. Under gunicorn --preload it runs once
+    before the workers are forked, and the workers share the
+    loaded modules instead of each loading them on first use.
+    Nothing that holds connections or threads is created here.
+    """
+    cx_plot = plotting()
+    cx_plot.get_resources()
+    score_chunk(["preload"], ENV.str("SENTIMENT_BACKEND", "textblob"))
+    LOGGER.debug("Preloaded bokeh %s and the sentiment backend.", cx_plot.BOKEH_VERSION)
+
+
+def create_app(preload_modules=None):
+    """
+    Creates the flask app. The twitter client and the data are
+    created per process on first use, so the app can be created
+    before gunicorn forks its workers.
+
+    :param preload_modules: imports the heavy modules now, APP_PRELOAD by default
+    :type preload_modules: bool
+    :returns: app
+    :rtype: Flask
+    """
+    flask_app = Flask(__name__)
+    flask_app.config["SECRET_KEY"] = "customerxp"
+    flask_app.register_blueprint(views)
+    flask_app.register_blueprint(api_blueprint)
+    flask_app.before_request(start_request)
+    flask_app.after_request(finish_request)
+
+    if ENV.bool("APP_PRELOAD", False) if preload_modules is None else preload_modules:
+        preload()
+
+    return flask_app
+
+
+app = create_app()
+
 # Helps to run in debug more as an application while development to avoid frequent restarts.
 if __name__ == "__main__":
     app.run(debug=True)
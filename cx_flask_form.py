@@ -1,7 +1,9 @@
 #!/usr/bin/python3
 from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField
-from wtforms.validators import DataRequired, Length
+from wtforms import StringField, SubmitField, TextAreaField
+from wtforms.validators import DataRequired, Length, ValidationError
+
+from cx_utility import TwitterUtility
 
 
 class TwitterHandleForm(FlaskForm):
@@ -21,3 +23,51 @@ class TwitterHandleForm(FlaskForm):
     twitter_handle_error.data = " "
 
     submit = SubmitField("Compare Sentiment and Classify Data")
+
+
+class CompareHandlesForm(FlaskForm):
+    '''
+    A class to handle fields and validation of a form to compare
+    a number of twitter handles.
+    '''
+
+    min_handles = 2
+    max_handles = 16
+
+    twitter_handles = TextAreaField(
+        "Enter the Twitter Handles to compare, separated by commas",
+        validators=[DataRequired()],
+    )
+    twitter_handle_error = StringField("")
+    twitter_handle_error.data = " "
+
+    submit = SubmitField("Compare Sentiment")
+
+    def get_handles(self):
+        '''
+        Returns the twitter handles entered, without duplicates.
+        Spellings of a handle are duplicates only if the store keeps
+        their data together, see TweetStore.key.
+        '''
+        store = TwitterUtility.get_instance().store
+        handles = {}
+        for handle in str(self.twitter_handles.data).replace("\n", ",").split(","):
+            handle = handle.strip()
+            if handle:
+                handles.setdefault(store.key(handle), handle)
+        return list(handles.values())
+
+    def validate_twitter_handles(self, field):
+        '''
+        Checks the number of twitter handles and their length.
+        '''
+        handles = self.get_handles()
+        if not self.min_handles <= len(handles) <= self.max_handles:
+            raise ValidationError(
+                f"Enter between {self.min_handles} and {self.max_handles} twitter handles."
+            )
+        for handle in handles:
+            if not 5 <= len(handle) <= 10:
+                raise ValidationError(
+                    f"Twitter handle {handle} should be between 5 and 10 characters."
+                )
@@ -4,13 +4,26 @@ All the calls to twitter API are managed here.
 """
 import os
 import logging
+import math
+import threading
+
+from requests.adapters import HTTPAdapter
 
 from tweepy import OAuthHandler
 from tweepy import API
+from tweepy import Cursor
 from tweepy import TweepError
 from environs import Env
 from cx_utility import CustomerExperienceException
 from cx_utility import TwitterUtility
+from cx_rate_limit import UPSTREAM
+from cx_single_flight import SingleFlight
+from cx_metrics import UPSTREAM_ERRORS, UPSTREAM_SECONDS
+
+
+# Only one fetch or validation of a twitter handle runs at a time,
+# across the threads and the processes of the app.
+SINGLE_FLIGHT = SingleFlight()
 
 
 
@@ -25,6 +38,27 @@ class TwitterAPI:
     :raises: :class:`CustomerExperienceException`: API keys are not valid.
     """
 
+    # the instance shared by the threads of a process
+    __instance = None
+    __instance_pid = None
+    __instance_lock = threading.Lock()
+
+    @staticmethod
+    def get_instance():
+        """
+        Returns the client shared by the threads of this process,
+        creating it on first use. Worker processes forked from a
+        process that already had a client create their own, as
+        connections can not be shared across processes.
+
+        :raises: :class:`CustomerExperienceException`: API keys are not valid.
+        """
+        with TwitterAPI.__instance_lock:
+            if TwitterAPI.__instance is None or TwitterAPI.__instance_pid != os.getpid():
+                TwitterAPI.__instance = TwitterAPI()
+                TwitterAPI.__instance_pid = os.getpid()
+            return TwitterAPI.__instance
+
     def __init__(self):
         try:
             # A logger is used to avoid writing everything to screen and
@@ -42,12 +76,33 @@ class TwitterAPI:
             self.logger = logging.getLogger("TwitterAPI")
             self.authenticate_twitter_app()
             self.twitter_client = API(self.twitter_authenticator)
+            self.mount_connection_pool()
+            # user_timeline returns at most 200 tweets per page.
+            self.fetch_count = Env().int("TWEET_FETCH_COUNT", 50)
             self.twitter_utility = TwitterUtility.get_instance()
         except CustomerExperienceException as identifier:
             self.logger.fatal("Constructor in TwitterAPI failed.")
             self.logger.fatal(identifier)
             raise CustomerExperienceException(identifier)
 
+    def mount_connection_pool(self):
+        """
+        Keeps the connections to the API open between calls, with
+        up to TWITTER_POOL_SIZE connections for the threads of the
+        process. Only clients that keep a requests session, like
+        tweepy 4, can be pooled. Tweepy 3 opens a session for
+        every call.
+        """
+        session = getattr(self.twitter_client, "session", None)
+        if session is None:
+            self.logger.debug("The twitter client has no session to pool.")
+            return
+
+        pool_size = Env().int("TWITTER_POOL_SIZE", 10)
+        session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        )
+
     def get_twitter_client_api(self):
         """
         Gets an instance of twitter api client.
@@ -55,41 +110,119 @@ class TwitterAPI:
         """
         return self.twitter_client
 
+    @UPSTREAM_SECONDS.time(call="get_tweets")
     def get_tweets(self, user):
         """
-        A method to fetch data and write to a csv file.
+        A method to fetch data and write to a csv file. Callers
+        asking for the same twitter handle at the same time share
+        one fetch, and the fetch is skipped if the data was
+        refreshed while waiting for it.
+
+        :param user: twitter handle
+        :type user: str
+
+        :raises: :class:`RateLimitExceeded`: The budget of API calls is used up.
+        """
+        SINGLE_FLIGHT.do(
+            "tweets-" + self.twitter_utility.store.key(user),
+            lambda: self.fetch_tweets(user),
+            check=lambda: True if self.twitter_utility.is_data_in_cache(user) else None,
+        )
+
+    def fetch_tweets(self, user):
+        """
+        Fetches tweets and writes them to a csv file. Only the
+        tweets newer than the ones already stored are fetched.
 
         :param user: twitter handle
         :type user: str
-        :param file: name of the file
-        :type file: str
+
+        :raises: :class:`RateLimitExceeded`: The budget of API calls is used up.
         """
         try:
-            api = self.get_twitter_client_api()
-            # twitter user should be checked for null
-            tweets = api.user_timeline(screen_name=user, count=50)
+            tweets = self.download_tweets(user)
             self.twitter_utility.save_data(user, tweets)
         except TweepError as identifier:
+            UPSTREAM_ERRORS.inc(call="user_timeline")
             self.logger.error(identifier)
 
+    def download_tweets(self, user):
+        """
+        Fetches the tweets of a twitter handle that are newer than
+        the ones already stored, without storing them.
+
+        :param user: twitter handle
+        :type user: str
+        :returns: tweets
+        :rtype: list
+
+        :raises: :class:`RateLimitExceeded`: The budget of API calls is used up.
+        :raises: :class:`TweepError`: The API returned an error.
+        """
+        api = self.get_twitter_client_api()
+        # twitter user should be checked for null
+        parameters = {"screen_name": user}
+        since_id = self.twitter_utility.get_latest_tweet_id(user)
+        if since_id is not None:
+            parameters["since_id"] = since_id
+
+        # a page of up to 200 tweets per call
+        self.twitter_utility.acquire_rate_limit(UPSTREAM, math.ceil(self.fetch_count / 200))
+        if self.fetch_count <= 200:
+            tweets = api.user_timeline(count=self.fetch_count, **parameters)
+        else:
+            tweets = list(
+                Cursor(api.user_timeline, count=200, **parameters).items(
+                    self.fetch_count
+                )
+            )
+        self.logger.debug("Fetched %d tweets for %s since %s.", len(tweets), user, since_id)
+        return tweets
+
+    @UPSTREAM_SECONDS.time(call="is_user_valid")
     def is_user_valid(self, user):
         """
         A method to check the validity of twitter handle using API.
+        Callers asking for the same twitter handle at the same time
+        share one call.
 
         :param user: twitter handle
         :type user: str
         :returns: valid
         :rtype: bool
+
+        :raises: :class:`CustomerExperienceException`: Connection to API fails.
+        :raises: :class:`RateLimitExceeded`: The budget of API calls is used up.
+        """
+        return SINGLE_FLIGHT.do(
+            "user-" + self.twitter_utility.handle_index.key(user),
+            lambda: self.check_user(user),
+            check=lambda: self.twitter_utility.lookup_user(user),
+        )
+
+    def check_user(self, user):
+        """
+        Checks the validity of twitter handle using API and
+        adds it to the valid or invalid list.
+
+        :param user: twitter handle
+        :type user: str
+        :returns: valid
+        :rtype: bool
+
+        :raises: :class:`RateLimitExceeded`: The budget of API calls is used up.
         """
         valid = False
         try:
             api = self.get_twitter_client_api()
+            self.twitter_utility.acquire_rate_limit(UPSTREAM)
             twitter_u = api.get_user(user)
             self.logger.debug("Twitter user id - %s", twitter_u.id_str)
             self.logger.debug("Twitter user screen name - %s", twitter_u.screen_name)
             valid = True
             self.twitter_utility.write_to_user_list(user, valid)
         except TweepError as identifier:
+            UPSTREAM_ERRORS.inc(call="get_user")
             self.logger.error(identifier.reason)
             self.logger.error("Twitter returned error while user validation - %s", identifier)
             # if the connection to twitter api fails
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""
+A cache of parsed tweets of twitter handles, so pages can be
+displayed without parsing the same file again. An entry is only
+used while the version of the file, its modification time and
+size, is the same as when it was read.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from environs import Env
+
+
+class FrameCache:
+    """
+    A least recently used cache of DataFrames with a limit on the
+    memory used by all of them. The frames are shared by all the
+    callers and must not be modified in place.
+
+    :param max_bytes: memory budget of the cache
+    :type max_bytes: int
+    """
+
+    def __init__(self, max_bytes=None):
+        env = Env()
+        env.read_env()
+        self.max_bytes = (
+            int(env.float("FRAME_CACHE_MAX_MB", 256) * 1024 * 1024)
+            if max_bytes is None
+            else max_bytes
+        )
+
+        self.frames = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.logger = logging.getLogger("FrameCache")
+
+    def get(self, key, version, loader):
+        """
+        Returns the cached frame of a key if its version matches,
+        otherwise loads the frame and caches it.
+
+        :param key: key of the frame, e.g. the name of the file
+        :type key: str
+        :param version: version of the data, e.g. (mtime, size)
+        :type version: tuple
+        :param loader: function without arguments that loads the frame
+        :type loader: callable
+        :returns: frame
+        :rtype: DataFrame
+        """
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is not None and entry[0] == version:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        frame = loader()
+        nbytes = int(frame.memory_usage(index=True, deep=True).sum())
+
+        with self.lock:
+            old_entry = self.frames.pop(key, None)
+            if old_entry is not None:
+                self.total_bytes -= old_entry[2]
+
+            if nbytes <= self.max_bytes:
+                self.frames[key] = (version, frame, nbytes)
+                self.total_bytes += nbytes
+                while self.total_bytes > self.max_bytes:
+                    _, (_, _, evicted_bytes) = self.frames.popitem(last=False)
+                    self.total_bytes -= evicted_bytes
+                    self.evictions += 1
+            else:
+                self.logger.debug("Frame %s is larger than the cache.", key)
+
+        return frame
+
+    def invalidate(self, key):
+        """
+        Removes the frame of a key.
+
+        :param key: key of the frame
+        :type key: str
+        """
+        with self.lock:
+            entry = self.frames.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[2]
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        :returns: stats
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "frames": len(self.frames),
+                "bytes": self.total_bytes,
+            }
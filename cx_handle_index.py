@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+"""
+An index of the twitter handles in the valid and invalid lists.
+The lists are read once and kept in memory as dictionaries, so a
+lookup does not read the files. New lines appended to the files,
+by this or by another process, are read from the last known
+position when the files are checked for changes. Each line is a
+handle and the time it was checked, handle,timestamp, so entries
+keep their age when the lists are read again. Lines without a time,
+written before the times were kept, count as expired.
+"""
+import logging
+import os
+import threading
+import time
+
+from environs import Env
+
+
+def parse_line(line):
+    """
+    Parses a line of a list, handle,timestamp or handle.
+
+    :param line: line of a list
+    :type line: str
+    :returns: handle, time it was checked, zero if unknown
+    :rtype: tuple
+    """
+    handle, _, added = line.partition(",")
+    try:
+        added = float(added)
+    except ValueError:
+        added = 0.0
+    return handle.strip(), added
+
+
+def format_line(handle, added):
+    """
+    Formats a line of a list, see parse_line.
+    """
+    return f"{handle},{added:.3f}\n"
+
+
+class HandleIndex:
+    """
+    A case insensitive index of valid and invalid twitter handles.
+    Entries expire after a time to live, so a handle can be checked
+    with the API again. A handle in both lists takes the outcome of
+    its latest check that has not expired.
+
+    :param valid_file: list of valid twitter handles
+    :type valid_file: str
+    :param invalid_file: list of invalid twitter handles
+    :type invalid_file: str
+    """
+
+    def __init__(self, valid_file="data/users_valid.csv",
+                 invalid_file="data/users_invalid.csv"):
+        env = Env()
+        env.read_env()
+        # zero hours means the entries do not expire
+        self.valid_ttl = env.float("HANDLE_VALID_TTL_HOURS", 0) * 3600
+        self.invalid_ttl = env.float("HANDLE_INVALID_TTL_HOURS", 24) * 3600
+        self.check_seconds = env.float("HANDLE_INDEX_CHECK_SECONDS", 5)
+        self.compact_duplicates = env.int("HANDLE_INDEX_COMPACT_DUPLICATES", 1000)
+
+        self.files = {True: valid_file, False: invalid_file}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("HandleIndex")
+        self.reload()
+
+    def reload(self):
+        """
+        Reads both lists from the start.
+        """
+        with self.lock:
+            self.entries = {True: {}, False: {}}
+            self.positions = {True: 0, False: 0}
+            self.inodes = {True: None, False: None}
+            self.lines = {True: 0, False: 0}
+            self.read_new_lines()
+            self.last_check = time.monotonic()
+
+    def read_new_lines(self):
+        """
+        Reads the lines added to the lists since the last read.
+        A list that was replaced or truncated is read from the start.
+        Must be called with the lock held.
+        """
+        for valid, file in self.files.items():
+            try:
+                stat = os.stat(file)
+            except FileNotFoundError:
+                continue
+
+            if stat.st_ino != self.inodes[valid] or stat.st_size < self.positions[valid]:
+                self.entries[valid] = {}
+                self.positions[valid] = 0
+                self.inodes[valid] = stat.st_ino
+                self.lines[valid] = 0
+
+            if stat.st_size == self.positions[valid]:
+                continue
+
+            with open(file, "rb") as f_user:
+                f_user.seek(self.positions[valid])
+                data = f_user.read()
+            # a line still being written is read on the next check
+            complete = data[: data.rfind(b"\n") + 1]
+            self.positions[valid] += len(complete)
+
+            for line in complete.decode("utf-8").splitlines():
+                handle, added = parse_line(line)
+                if handle:
+                    self.set_entry(valid, handle, added)
+                    self.lines[valid] += 1
+
+    def set_entry(self, valid, handle, added):
+        """
+        Adds a handle to the index of a list, unless the index has
+        a later check of the handle. Must be called with the lock held.
+        """
+        key = self.key(handle)
+        entry = self.entries[valid].get(key)
+        if entry is None or entry[1] <= added:
+            self.entries[valid][key] = (handle, added)
+
+    def refresh(self):
+        """
+        Checks the lists for new lines, at most once every
+        HANDLE_INDEX_CHECK_SECONDS, and compacts them if they
+        have too many duplicates.
+        """
+        with self.lock:
+            if time.monotonic() - self.last_check < self.check_seconds:
+                return
+            self.last_check = time.monotonic()
+            self.read_new_lines()
+            duplicates = (
+                sum(self.lines.values()) - len(self.entries[True]) - len(self.entries[False])
+            )
+
+        if duplicates > self.compact_duplicates:
+            self.compact()
+
+    def is_fresh(self, valid, added):
+        """
+        Checks the time to live of an entry.
+        """
+        ttl = self.valid_ttl if valid else self.invalid_ttl
+        return ttl <= 0 or time.time() - added < ttl
+
+    @staticmethod
+    def key(handle):
+        """
+        Returns the key of a twitter handle in the index, the same
+        for every spelling of the handle.
+        """
+        return handle.strip().casefold()
+
+    def lookup(self, handle):
+        """
+        Looks up a twitter handle.
+
+        :param handle: twitter handle
+        :type handle: str
+        :returns: True if valid, False if invalid and None if unknown
+            or expired
+        :rtype: bool
+        """
+        self.refresh()
+        key = self.key(handle)
+        latest = None
+        with self.lock:
+            for valid in (True, False):
+                entry = self.entries[valid].get(key)
+                if entry is None or not self.is_fresh(valid, entry[1]):
+                    continue
+                # the latest check wins, invalid if both were checked at once
+                if latest is None or entry[1] >= latest[0]:
+                    latest = (entry[1], valid)
+        return None if latest is None else latest[1]
+
+    def add(self, handle, valid):
+        """
+        Appends a twitter handle to a list and to the index. The
+        position in the list is moved past the line, so it is not
+        read and counted again, unless another process appended
+        lines that were not read yet.
+
+        :param handle: twitter handle
+        :type handle: str
+        :param valid: indicates the validity of handle
+        :type valid: bool
+        """
+        handle = handle.strip()
+        # the time as it is written to the list
+        added = round(time.time(), 3)
+        data = format_line(handle, added).encode("utf-8")
+        with self.lock:
+            with open(self.files[valid], "ab") as f_user:
+                f_user.write(data)
+                end = f_user.tell()
+                inode = os.fstat(f_user.fileno()).st_ino
+
+            start = self.positions[valid] if inode == self.inodes[valid] else 0
+            if end - len(data) == start:
+                self.positions[valid] = end
+                self.inodes[valid] = inode
+                if start == 0:
+                    self.entries[valid] = {}
+                    self.lines[valid] = 0
+                self.lines[valid] += 1
+            self.set_entry(valid, handle, added)
+
+    def compact(self):
+        """
+        Rewrites both lists without duplicates. A handle in both
+        lists is kept in the list of its latest check only.
+        The files are replaced, so readers never see half a list.
+        Handles appended by another process while the lists are
+        rewritten can be lost, and are then checked with the API again.
+        """
+        with self.lock:
+            self.read_new_lines()
+            valid_entries = self.entries[True]
+            invalid_entries = self.entries[False]
+
+            keep_valid = {
+                key: entry for key, entry in valid_entries.items()
+                if key not in invalid_entries or entry[1] > invalid_entries[key][1]
+            }
+            keep_invalid = {
+                key: entry for key, entry in invalid_entries.items()
+                if key not in keep_valid
+            }
+
+            for valid, entries in ((True, keep_valid), (False, keep_invalid)):
+                file = self.files[valid]
+                temp_file = f"{file}.{os.getpid()}.tmp"
+                with open(temp_file, "w") as f_user:
+                    f_user.writelines(
+                        format_line(handle, added) for handle, added in entries.values()
+                    )
+                os.replace(temp_file, file)
+
+                stat = os.stat(file)
+                self.entries[valid] = entries
+                self.positions[valid] = stat.st_size
+                self.inodes[valid] = stat.st_ino
+                self.lines[valid] = len(entries)
+
+        self.logger.info(
+            "Compacted handle lists to %d valid and %d invalid handles.",
+            len(keep_valid), len(keep_invalid),
+        )
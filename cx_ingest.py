@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+"""
+Ingests tweets from JSON lines, e.g. archived exports or a
+recording of the streaming API, without loading them all at once.
+The tweets flow through a pipeline of generators:
+
+    parse -> micro-batches -> clean and score -> store
+
+Parsing and scoring run on their own threads and hand their output
+to the next stage through bounded queues. A stage that is ahead
+waits for the next one, so the tweets in flight are bounded by the
+size of the queues times the size of the batches, whatever the size
+of the input. The store is another matter: the sqlite store upserts
+a batch into its table, while the file stores read and write the
+whole file of a handle for every batch, so their cost and memory grow
+with the tweets already stored. Large backfills should use the sqlite
+store. The triage index is updated once per handle at the end. The
+writes of a handle hold the same lock as the fetches of the app, so
+they do not overwrite each other.
+
+python cx_ingest.py archive.jsonl.gz --no-retention
+cat tweets.jsonl | python cx_ingest.py - --handle Coles
+"""
+import argparse
+import queue
+import threading
+import time
+
+import numpy as np
+
+from cx_form_handler import SINGLE_FLIGHT
+from cx_records import open_jsonl, read_jsonl
+from cx_utility import TwitterUtility
+from cx_warm import StageStats
+
+
+# Marks the end of the items of a queue.
+_DONE = object()
+
+
+def buffered(items, maxsize):
+    """
+    Iterates over a generator on a thread of its own, ahead of the
+    caller by up to maxsize items. Errors of the generator are raised
+    in the caller. When the caller stops early, the thread stops and
+    closes the generator, instead of waiting for a free slot forever.
+
+    :param items: generator
+    :type items: iterable
+    :param maxsize: items kept ahead of the caller
+    :type maxsize: int
+    :returns: items
+    :rtype: generator
+    """
+    items_queue = queue.Queue(maxsize=maxsize)
+    errors = []
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    break
+        except Exception as identifier:  # pylint: disable=broad-except
+            errors.append(identifier)
+        finally:
+            # stops the stages before this one as well
+            if hasattr(items, "close"):
+                items.close()
+            put(_DONE)
+
+    # a daemon, so the thread does not keep a failed ingest running
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items_queue.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop.set()
+    if errors:
+        raise errors[0]
+
+
+def micro_batches(tweets, batch_size, handle, stats):
+    """
+    Groups tweets into lists of batch_size tweets. Tweets without
+    a twitter handle are skipped, unless the handle is given.
+
+    :param tweets: tweets
+    :type tweets: iterable of TweetRecord
+    :param batch_size: tweets per batch
+    :type batch_size: int
+    :param handle: twitter handle of all the tweets, the handle of
+        the user of each tweet if None
+    :type handle: str
+    :param stats: throughput of the stages
+    :type stats: StageStats
+    :returns: batches
+    :rtype: generator of list
+    """
+    batch = []
+    start = time.perf_counter()
+    for tweet in tweets:
+        if handle is not None:
+            tweet.handle = handle
+        elif not tweet.handle:
+            stats.add("skip", 1, 0.0)
+            continue
+
+        batch.append(tweet)
+        if len(batch) >= batch_size:
+            stats.add("parse", len(batch), time.perf_counter() - start)
+            yield batch
+            batch = []
+            start = time.perf_counter()
+
+    if batch:
+        stats.add("parse", len(batch), time.perf_counter() - start)
+        yield batch
+
+
+def score_batches(batches, cx_utility, stats):
+    """
+    Cleans and scores batches of tweets, and splits them by
+    twitter handle.
+
+    :param batches: batches of tweets
+    :type batches: iterable of list
+    :param cx_utility: utility used to clean and score the tweets
+    :type cx_utility: TwitterUtility
+    :param stats: throughput of the stages
+    :type stats: StageStats
+    :returns: the tweets of each handle in a batch
+    :rtype: generator of list of (handle, DataFrame)
+    """
+    for batch in batches:
+        start = time.perf_counter()
+        df_tweets = cx_utility.tweets_to_data_frame(batch)
+        handles = np.array([tweet.handle for tweet in batch], dtype=object)
+        frames = [
+            (handle, df_handle.reset_index(drop=True))
+            for handle, df_handle in df_tweets.groupby(handles, sort=False)
+        ]
+        stats.add("score", len(batch), time.perf_counter() - start)
+        yield frames
+
+
+def ingest(lines, cx_utility, batch_size=1000, queue_size=4, handle=None,
+           retention=True, stats=None):
+    """
+    Stores the tweets of JSON lines, a batch at a time.
+
+    :param lines: JSON lines, e.g. an open file
+    :type lines: iterable
+    :param cx_utility: utility used to score and store the tweets
+    :type cx_utility: TwitterUtility
+    :param batch_size: tweets per batch
+    :type batch_size: int
+    :param queue_size: batches kept ahead of the next stage
+    :type queue_size: int
+    :param handle: twitter handle of all the tweets, the handle of
+        the user of each tweet if None
+    :type handle: str
+    :param retention: removes the tweets outside of the retention window
+    :type retention: bool
+    :param stats: throughput of the stages
+    :type stats: StageStats
+    :returns: number of tweets stored per twitter handle
+    :rtype: dict
+    """
+    stats = stats or StageStats()
+    batches = buffered(
+        micro_batches(read_jsonl(lines), batch_size, handle, stats), queue_size
+    )
+    scored = buffered(score_batches(batches, cx_utility, stats), queue_size)
+
+    def handle_lock(user):
+        # the lock of the fetches of the handle, see TwitterAPI.get_tweets
+        return SINGLE_FLIGHT.file_lock("tweets-" + cx_utility.store.key(user))
+
+    counts = {}
+    for frames in scored:
+        for user, df_tweets in frames:
+            start = time.perf_counter()
+            with handle_lock(user):
+                cx_utility.save_data_frame(user, df_tweets, retention, triage=False)
+            stats.add("write", len(df_tweets), time.perf_counter() - start)
+            counts[user] = counts.get(user, 0) + len(df_tweets)
+
+    for user, count in counts.items():
+        start = time.perf_counter()
+        with handle_lock(user):
+            cx_utility.sync_triage(user)
+        stats.add("triage", count, time.perf_counter() - start)
+    return counts
+
+
+def main():
+    """
+    Ingests tweets from files of JSON lines or stdin.
+    """
+    parser = argparse.ArgumentParser(description="Score and store tweets from JSON lines.")
+    parser.add_argument("files", nargs="+", help="files of JSON lines, .gz or - for stdin")
+    parser.add_argument("--handle", help="twitter handle of all the tweets, "
+                        "the screen name of the user of each tweet by default")
+    parser.add_argument("--batch-size", type=int, default=1000, help="tweets scored at a time")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="batches kept ahead of the next stage")
+    parser.add_argument("--no-retention", action="store_true",
+                        help="keeps all the tweets, to backfill history")
+    arguments = parser.parse_args()
+
+    cx_utility = TwitterUtility.get_instance()
+    stats = StageStats()
+    start = time.perf_counter()
+    counts = {}
+    for path in arguments.files:
+        with open_jsonl(path) as f_jsonl:
+            for user, count in ingest(
+                    f_jsonl,
+                    cx_utility,
+                    batch_size=max(arguments.batch_size, 1),
+                    queue_size=max(arguments.queue_size, 1),
+                    handle=arguments.handle,
+                    retention=not arguments.no_retention,
+                    stats=stats,
+            ).items():
+                counts[user] = counts.get(user, 0) + count
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Stored {sum(counts.values())} tweets of {len(counts)} twitter handles "
+        f"in {elapsed:.2f} s."
+    )
+    for line in stats.report():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
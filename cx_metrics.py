@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+"""
+Timers and counters of the stages of the app, e.g. the calls to
+the twitter API, the scoring of tweets, the reads and writes of
+the store and the rendering of plots. They are kept in memory by
+each process and exposed in the Prometheus text format on /metrics.
+An observation takes a lock and a few additions, so the stages can
+be timed on every request.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+
+# Upper bounds of the buckets of the latency histograms, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(labels):
+    """
+    Formats labels as {name="value",...}, empty without labels.
+    """
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    """
+    A value that only goes up, per combination of labels.
+
+    :param name: name of the metric
+    :type name: str
+    :param documentation: help of the metric
+    :type documentation: str
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        """
+        Adds an amount to the counter of the labels.
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        """
+        Returns the lines of the metric.
+        """
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}{format_labels(key)} {value}" for key, value in values]
+
+
+class Histogram:
+    """
+    Counts of observations, e.g. latencies, in buckets, with their
+    sum and count, per combination of labels.
+
+    :param name: name of the metric
+    :type name: str
+    :param documentation: help of the metric
+    :type documentation: str
+    :param buckets: upper bounds of the buckets, increasing
+    :type buckets: tuple
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # labels -> [counts per bucket and +Inf, sum]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        """
+        Adds an observation to the histogram of the labels.
+        """
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, **labels):
+        """
+        Returns a decorator and context manager that observes the
+        time taken by a function or a block.
+        """
+        return _Timer(self, labels)
+
+    def samples(self):
+        """
+        Returns the lines of the metric, with cumulative buckets.
+        """
+        with self.lock:
+            values = [(key, list(entry[0]), entry[1]) for key, entry in self.values.items()]
+
+        lines = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = key + (("le", bound),)
+                lines.append(f"{self.name}_bucket{format_labels(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    """
+    Observes the time taken by a function or a block in a histogram.
+    """
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.local = threading.local()
+
+    def __enter__(self):
+        self.local.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.local.start, **self.labels)
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.histogram.observe(time.perf_counter() - start, **self.labels)
+
+        return timed
+
+
+class Registry:
+    """
+    The metrics of a process. Collectors are functions called when
+    the metrics are rendered, returning the lines of metrics that are
+    counted elsewhere, like the counters of the caches.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, documentation):
+        """
+        Creates and registers a counter.
+        """
+        metric = Counter(name, documentation)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS):
+        """
+        Creates and registers a histogram.
+        """
+        metric = Histogram(name, documentation, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """
+        Registers a function without arguments that returns a list
+        of (name, kind, documentation, [(labels, value)]).
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """
+        Returns all the metrics in the Prometheus text format.
+
+        :returns: metrics
+        :rtype: str
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+
+        for collector in self.collectors:
+            for name, kind, documentation, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(
+                    f"{name}{format_labels(tuple(sorted(labels.items())))} {value}"
+                    for labels, value in samples
+                )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Time of the stages of a request, e.g. score, save, load, render.
+STAGE_SECONDS = REGISTRY.histogram(
+    "cx_stage_seconds", "Time spent in a stage of the app, in seconds."
+)
+# Calls to the twitter API, with the single flight and the rate limit.
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "cx_upstream_seconds", "Time of the calls to the twitter API, in seconds."
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "cx_upstream_errors_total", "Errors returned by the twitter API."
+)
+RATE_LIMITED = REGISTRY.counter(
+    "cx_rate_limited_total", "Requests refused by a rate limit budget."
+)
+TWEETS_SCORED = REGISTRY.counter(
+    "cx_tweets_scored_total", "Tweets cleaned and scored."
+)
+DATA_CACHE = REGISTRY.counter(
+    "cx_data_cache_total", "Checks of the stored tweets of a handle, fresh is a hit."
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "cx_request_seconds", "Time to respond to a request, to the first byte if streamed."
+)
+REQUESTS = REGISTRY.counter(
+    "cx_requests_total", "Requests by endpoint and status."
+)
@@ -0,0 +1,289 @@
+#!/usr/bin/python3
+"""
+Plots of the sentiment of twitter handles with bokeh. The
+script and div of a plot are cached until the data of one of
+the handles changes, and BokehJS is served as static files that
+browsers can cache instead of being inlined in every page.
+"""
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import bokeh
+from bokeh.embed import components
+from bokeh.plotting import figure
+from bokeh.resources import CDN, INLINE, Resources
+from bokeh.models import ColumnDataSource
+from bokeh.models.tools import HoverTool
+from bokeh.palettes import Category20
+
+from environs import Env
+
+from cx_aggregate import compare_handles, downsample, rollup_sentiment
+from cx_metrics import STAGE_SECONDS
+
+try:
+    from bokeh.util.paths import bokehjsdir
+except ImportError:  # newer versions of bokeh
+    from bokeh.util.paths import bokehjs_path as bokehjsdir
+
+
+BOKEH_VERSION = bokeh.__version__
+
+
+def bokeh_static_dir():
+    """
+    Returns the directory of the BokehJS files of the installed bokeh.
+    """
+    return str(bokehjsdir())
+
+
+@lru_cache(maxsize=None)
+def get_resources(root_url="/bokeh/"):
+    """
+    Returns the bokeh resources selected by BOKEH_RESOURCES. Local
+    serves BokehJS from this app under a url that contains the
+    version of bokeh, so it can be cached for a long time. Cdn uses
+    the bokeh CDN and inline puts BokehJS in every page.
+
+    :param root_url: url the static files are served from
+    :type root_url: str
+    :returns: resources
+    :rtype: Resources
+    """
+    env = Env()
+    env.read_env()
+    mode = env.str("BOKEH_RESOURCES", "local")
+    if mode == "cdn":
+        return CDN
+    if mode == "inline":
+        return INLINE
+    return Resources(mode="server", root_url=f"{root_url}{BOKEH_VERSION}/")
+
+
+class RenderCache:
+    """
+    A least recently used cache of rendered plots, the script and
+    div returned by components.
+
+    :param max_size: maximum number of plots
+    :type max_size: int
+    """
+
+    def __init__(self, max_size=None):
+        env = Env()
+        env.read_env()
+        self.max_size = env.int("PLOT_CACHE_SIZE", 128) if max_size is None else max_size
+        self.plots = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """
+        Returns the cached plot of a key or renders it.
+
+        :param key: handles and versions of their data
+        :type key: tuple
+        :param render: function without arguments returning (script, div)
+        :type render: callable
+        :returns: script, div
+        :rtype: tuple
+        """
+        with self.lock:
+            if key in self.plots:
+                self.plots.move_to_end(key)
+                self.hits += 1
+                return self.plots[key]
+            self.misses += 1
+
+        plot = render()
+        with self.lock:
+            self.plots[key] = plot
+            while len(self.plots) > self.max_size:
+                self.plots.popitem(last=False)
+        return plot
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+        """
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "plots": len(self.plots)}
+
+
+RENDER_CACHE = RenderCache()
+
+
+def comparison_figure(df_user, df_competitor, user_handle, competitor_handle):
+    """
+    Creates a plot of the sentiment of tweets of two twitter handles.
+    The tweets are downsampled to PLOT_MAX_POINTS per handle, and a
+    line shows the mean sentiment of each time bucket.
+
+    :param df_user: tweets of the user
+    :type df_user: DataFrame
+    :param df_competitor: tweets of the competitor
+    :type df_competitor: DataFrame
+    :param user_handle: twitter handle of the user
+    :type user_handle: str
+    :param competitor_handle: twitter handle of the competitor
+    :type competitor_handle: str
+    :returns: fig
+    :rtype: Figure
+    """
+    env = Env()
+    env.read_env()
+    max_points = env.int("PLOT_MAX_POINTS", 500)
+
+    fig = figure(plot_width=700, plot_height=400, x_axis_type="datetime")
+
+    scatters = []
+    for df_tweets, handle, color in (
+            (df_user, user_handle, "green"),
+            (df_competitor, competitor_handle, "red"),
+    ):
+        df_points = downsample(df_tweets[["date", "sentiment", "tweets"]], max_points)
+        scatters.append(fig.circle(
+            x="date",
+            y="sentiment",
+            source=ColumnDataSource(df_points),
+            size=10,
+            color=color,
+            alpha=0.6,
+            legend=handle,
+        ))
+
+        df_rollup = rollup_sentiment(df_tweets)
+        fig.line(
+            x="date",
+            y="mean",
+            source=ColumnDataSource(df_rollup),
+            line_width=2,
+            color=color,
+            legend=handle,
+        )
+
+    fig.title.text = "Customer Experience"
+    fig.xaxis.axis_label = "Time Window"
+    fig.yaxis.axis_label = "Sentiment"
+
+    fig.legend.location = "top_left"
+    fig.legend.click_policy = "hide"
+
+    hover = HoverTool(renderers=scatters)
+    hover.point_policy = "snap_to_data"
+    hover.line_policy = "none"
+
+    hover.tooltips = """
+    <div>
+        <div width: 100px word-wrap: break-word>
+            <span style="font-size: 10px;">@tweets</span>
+        </div>
+    </div>
+    """
+
+    fig.add_tools(hover)
+    return fig
+
+
+@STAGE_SECONDS.time(stage="render")
+def render_comparison(cx_utility, user_handle, competitor_handle):
+    """
+    Returns the script and div of the plot comparing two twitter
+    handles. The plot is rendered again only when the data of one
+    of the handles changes.
+
+    :param cx_utility: utility used to read the data
+    :type cx_utility: TwitterUtility
+    :param user_handle: twitter handle of the user
+    :type user_handle: str
+    :param competitor_handle: twitter handle of the competitor
+    :type competitor_handle: str
+    :returns: script, div
+    :rtype: tuple
+    """
+    key = (
+        "pair",
+        user_handle,
+        competitor_handle,
+        cx_utility.store.version(user_handle),
+        cx_utility.store.version(competitor_handle),
+    )
+    return RENDER_CACHE.get(
+        key,
+        lambda: components(
+            comparison_figure(
+                cx_utility.load_data(user_handle),
+                cx_utility.load_data(competitor_handle),
+                user_handle,
+                competitor_handle,
+            )
+        ),
+    )
+
+
+def handles_figure(df_buckets, handles):
+    """
+    Creates a plot of the mean sentiment of time buckets with one
+    line per twitter handle.
+
+    :param df_buckets: buckets from compare_handles
+    :type df_buckets: DataFrame
+    :param handles: twitter handles
+    :type handles: list
+    :returns: fig
+    :rtype: Figure
+    """
+    fig = figure(plot_width=900, plot_height=450, x_axis_type="datetime")
+    palette = Category20[20]
+
+    for position, handle in enumerate(handles):
+        source = ColumnDataSource(df_buckets[df_buckets["handle"] == handle].drop(columns="handle"))
+        color = palette[position % len(palette)]
+        fig.line(x="date", y="mean", source=source, line_width=2, color=color, legend=handle)
+        fig.circle(x="date", y="mean", source=source, size=5, color=color, legend=handle)
+
+    fig.title.text = "Customer Experience - Competitors"
+    fig.xaxis.axis_label = "Time Window"
+    fig.yaxis.axis_label = "Mean Sentiment"
+
+    fig.legend.location = "top_left"
+    fig.legend.click_policy = "hide"
+
+    hover = HoverTool()
+    hover.tooltips = [
+        ("mean", "@mean{0.00}"),
+        ("tweets", "@count"),
+        ("negative", "@negative_share{0%}"),
+    ]
+    fig.add_tools(hover)
+    return fig
+
+
+@STAGE_SECONDS.time(stage="render")
+def render_handles(cx_utility, handles, load_frames):
+    """
+    Returns the script and div of the plot comparing a number of
+    twitter handles, and the summary of every handle. The plot and
+    summary are computed again only when the data of a handle changes.
+
+    :param cx_utility: utility used to read the versions of the data
+    :type cx_utility: TwitterUtility
+    :param handles: twitter handles
+    :type handles: list
+    :param load_frames: function without arguments returning the
+        tweets by twitter handle
+    :type load_frames: callable
+    :returns: script, div, df_summary
+    :rtype: tuple
+    """
+    key = ("handles",) + tuple(handles) + tuple(
+        cx_utility.store.version(handle) for handle in handles
+    )
+
+    def render():
+        df_buckets, df_summary = compare_handles(load_frames())
+        return components(handles_figure(df_buckets, handles)) + (df_summary,)
+
+    return RENDER_CACHE.get(key, render)
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+"""
+Rate limits shared by all the threads and processes of the app.
+Each budget is a token bucket kept in a SQLite file under data/.
+A bucket holds up to limit tokens and is refilled at limit tokens
+per window, so short bursts are allowed while the average rate
+stays within the budget. A request that finds the bucket empty is
+told how long to wait, instead of being refused for good.
+"""
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from environs import Env
+
+
+# Budget of the calls to the twitter API.
+UPSTREAM = "upstream"
+# Budget of the pages displaying data.
+PAGE_VIEWS = "page_views"
+
+
+class RateLimiter:
+    """
+    Token buckets for the upstream API calls and the page views.
+    A limit of zero turns a budget off.
+
+    :param budgets: name -> (limit, window in seconds)
+    :type budgets: dict
+    :param path: name of the file used for the buckets
+    :type path: str
+    """
+
+    def __init__(self, budgets=None, path=None):
+        env = Env()
+        env.read_env()
+        # The user timeline of the twitter API allows 900 calls in 15 minutes.
+        self.budgets = budgets or {
+            UPSTREAM: (
+                env.int("UPSTREAM_RATE_LIMIT", 900),
+                env.float("UPSTREAM_RATE_WINDOW_SECONDS", 900),
+            ),
+            PAGE_VIEWS: (
+                env.int("PAGE_VIEW_RATE_LIMIT", 300),
+                env.float("PAGE_VIEW_RATE_WINDOW_SECONDS", 60),
+            ),
+        }
+        self.path = path or env.str("RATE_LIMIT_PATH", "data/rate_limit.db")
+        self.logger = logging.getLogger("RateLimiter")
+
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens a connection to the buckets and commits on success.
+        A connection is opened for every call, so the buckets can be
+        used from any thread or process.
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def acquire(self, name, tokens=1):
+        """
+        Takes tokens from a budget if it has enough of them.
+
+        :param name: name of the budget
+        :type name: str
+        :param tokens: number of tokens, e.g. API calls
+        :type tokens: int
+        :returns: seconds to wait before the tokens are available,
+            zero if they were taken
+        :rtype: float
+        """
+        limit, window = self.budgets[name]
+        if limit <= 0:
+            return 0.0
+        rate = limit / window
+        tokens = min(tokens, limit)
+
+        with self.connect() as connection:
+            # The write lock is held from the read to the update, so two
+            # processes can not take the same tokens.
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            available = float(limit) if row is None else min(
+                float(limit), row[0] + (now - row[1]) * rate
+            )
+
+            retry_after = 0.0
+            if available >= tokens:
+                available -= tokens
+            else:
+                retry_after = (tokens - available) / rate
+
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, available, now),
+            )
+
+        if retry_after:
+            self.logger.debug("Budget %s is used up for %.1f seconds.", name, retry_after)
+        return retry_after
+
+    def status(self):
+        """
+        Returns the tokens left in each budget.
+
+        :returns: name -> (tokens, limit, window in seconds)
+        :rtype: dict
+        """
+        with self.connect() as connection:
+            rows = dict(
+                (row[0], row[1:])
+                for row in connection.execute("SELECT name, tokens, updated FROM buckets")
+            )
+
+        now = time.time()
+        status = {}
+        for name, (limit, window) in self.budgets.items():
+            tokens, updated = rows.get(name, (limit, now))
+            if limit > 0:
+                tokens = min(float(limit), tokens + (now - updated) * limit / window)
+            status[name] = (tokens, limit, window)
+        return status
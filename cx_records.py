@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+"""
+Tweets recorded as JSON lines, one tweet per line in the JSON
+format of the twitter API. Recorded tweets can be scored and
+stored like the tweets fetched from the API, e.g. to warm the
+cache or to backfill history without calling the API.
+"""
+import gzip
+import io
+import json
+import logging
+import re
+import sys
+from datetime import datetime, timezone
+
+
+LOGGER = logging.getLogger("Records")
+
+# The source of a tweet is a link to the app, the name of the app is kept.
+SOURCE_REGEX = re.compile(r"<[^>]*>")
+
+
+class TweetRecord:
+    """
+    A tweet read from its JSON, with the attributes of the tweets
+    of tweepy that are stored: id, text, created_at, source and
+    favorite_count. Dates are in UTC without a time zone, like
+    the dates of tweepy.
+
+    :param data: tweet in the JSON format of the twitter API
+    :type data: dict
+
+    :raises: :class:`ValueError`: The tweet has no id, text or date.
+    """
+
+    __slots__ = ("id", "text", "created_at", "source", "favorite_count", "handle")
+
+    def __init__(self, data):
+        try:
+            self.id = int(data.get("id") or data["id_str"])
+            self.text = (
+                data.get("extended_tweet", {}).get("full_text")
+                or data.get("full_text")
+                or data["text"]
+            )
+            self.created_at = parse_date(data["created_at"])
+        except (AttributeError, KeyError, TypeError) as identifier:
+            raise ValueError(f"Tweet without {identifier}") from identifier
+
+        self.source = SOURCE_REGEX.sub("", data.get("source") or "")
+        self.favorite_count = int(data.get("favorite_count") or 0)
+        self.handle = (data.get("user") or {}).get("screen_name")
+
+
+def parse_date(value):
+    """
+    Parses the date of a tweet, in the format of the v1.1 API,
+    e.g. Wed Oct 10 20:19:24 +0000 2018, or in ISO format.
+
+    :param value: date
+    :type value: str
+    :returns: date in UTC without a time zone
+    :rtype: datetime
+
+    :raises: :class:`ValueError`: The date is not in a known format.
+    """
+    try:
+        date = datetime.strptime(value, "%a %b %d %H:%M:%S %z %Y")
+    except ValueError:
+        date = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def open_jsonl(path):
+    """
+    Opens a file of JSON lines, compressed with gzip if its name
+    ends with .gz, or stdin if the name is -.
+
+    :param path: name of the file
+    :type path: str
+    :returns: file
+    :rtype: file object
+    """
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def read_jsonl(lines):
+    """
+    Reads tweets from JSON lines, one at a time. Lines that are
+    empty or are not tweets are logged and skipped.
+
+    :param lines: JSON lines, e.g. an open file
+    :type lines: iterable
+    :returns: tweets
+    :rtype: generator of TweetRecord
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield TweetRecord(json.loads(line))
+        except ValueError as identifier:
+            LOGGER.warning("Skipped line %d - %s", number, identifier)
+
+
+def write_jsonl(tweets, f_jsonl):
+    """
+    Writes tweets fetched with tweepy as JSON lines, so they can
+    be read again with read_jsonl.
+
+    :param tweets: tweets of tweepy
+    :type tweets: list
+    :param f_jsonl: file to write to
+    :type f_jsonl: file object
+    """
+    for tweet in tweets:
+        f_jsonl.write(json.dumps(tweet._json) + "\n")
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+Refreshes the cached data of twitter handles in the background,
+so pages can be served from data that is a little out of date
+instead of waiting for the twitter API.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class BackgroundRefresher:
+    """
+    Runs refreshes of twitter handles on a pool of threads. A
+    handle is only refreshed once at a time, a request to refresh
+    a handle that is already pending is ignored. The last
+    refreshes are kept for the status page.
+
+    :param refresh: function that refreshes the data of a handle
+    :type refresh: callable
+    :param workers: number of threads
+    :type workers: int
+    :param history: number of finished refreshes kept
+    :type history: int
+    :param key: function returning the key of the data of a handle,
+        handles with the same key are refreshed once, the handle
+        itself by default
+    :type key: callable
+    """
+
+    def __init__(self, refresh, workers=2, history=20, key=None):
+        self.refresh = refresh
+        self.key = key or (lambda handle: handle)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.finished = deque(maxlen=history)
+        self.logger = logging.getLogger("BackgroundRefresher")
+
+    def schedule(self, handle):
+        """
+        Requests a refresh of a twitter handle.
+
+        :param handle: twitter handle
+        :type handle: str
+        :returns: scheduled, False if a refresh is already pending
+        :rtype: bool
+        """
+        key = self.key(handle)
+        with self.lock:
+            if key in self.pending:
+                return False
+            self.pending[key] = {"handle": handle, "requested": datetime.utcnow()}
+
+        self.logger.debug("Refresh of %s scheduled.", handle)
+        self.executor.submit(self.run, key)
+        return True
+
+    def run(self, key):
+        """
+        Refreshes a twitter handle and records the outcome.
+
+        :param key: key of the pending refresh
+        :type key: str
+        """
+        with self.lock:
+            entry = self.pending[key]
+            entry["started"] = datetime.utcnow()
+
+        try:
+            self.refresh(entry["handle"])
+            entry["status"] = "refreshed"
+        # A failed refresh must not stop the worker thread.
+        except Exception as identifier:  # pylint: disable=broad-except
+            self.logger.error("Refresh of %s failed - %s", entry["handle"], identifier)
+            entry["status"] = f"failed - {identifier}"
+        entry["finished"] = datetime.utcnow()
+
+        with self.lock:
+            del self.pending[key]
+            self.finished.appendleft(entry)
+
+    def status(self):
+        """
+        Returns the pending and the last finished refreshes.
+
+        :returns: pending, finished
+        :rtype: tuple
+        """
+        with self.lock:
+            return (
+                [dict(entry) for entry in self.pending.values()],
+                [dict(entry) for entry in self.finished],
+            )
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+"""
+Backends that turn cleaned tweets into a polarity between -1 and 1.
+TextBlob is the default backend. The lexicon backend uses the same
+word polarities as TextBlob, but scores a whole batch with NumPy
+instead of building a TextBlob object for every tweet. It is much
+cheaper for bulk jobs and close to, but not the same as, TextBlob.
+"""
+import csv
+import hashlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from environs import Env
+
+
+class SentimentBackend:
+    """
+    Interface of a sentiment backend. The name is used to select
+    the backend in config and the version is part of the key of
+    cached scores.
+    """
+
+    name = None
+    version = None
+
+    def score(self, cleaned_tweets):
+        """
+        Scores a batch of cleaned tweets.
+
+        :param cleaned_tweets: a collection of cleaned strings
+        :type cleaned_tweets: list
+        :returns: sentiments
+        :rtype: ndarray
+        """
+        raise NotImplementedError
+
+
+class TextBlobBackend(SentimentBackend):
+    """
+    Polarity of TextBlob, one TextBlob object per tweet.
+    """
+
+    name = "textblob"
+    version = "textblob-1"
+
+    def score(self, cleaned_tweets):
+        # Imported here, so processes using another backend do not load it.
+        from textblob import TextBlob
+
+        return np.fromiter(
+            (TextBlob(tweet).sentiment.polarity for tweet in cleaned_tweets),
+            dtype=float,
+            count=len(cleaned_tweets),
+        )
+
+
+class LexiconBackend(SentimentBackend):
+    """
+    Averages the polarity of the words of a tweet that are in a
+    lexicon. A word after a negation (not, never..) has its polarity
+    reversed and halved, like TextBlob does. Intensifiers such as
+    "very" are ignored.
+
+    The lexicon of TextBlob is used, unless a csv file with a word
+    and a polarity on every line is given or set in
+    SENTIMENT_LEXICON_PATH.
+
+    :param path: name of a csv file with a lexicon
+    :type path: str
+    """
+
+    name = "lexicon"
+    negations = ("no", "not", "n't", "never")
+
+    def __init__(self, path=None):
+        if path is None:
+            env = Env()
+            env.read_env()
+            path = env.str("SENTIMENT_LEXICON_PATH", "")
+
+        if path:
+            with open(path, "r") as f_lexicon:
+                lexicon = {
+                    row[0].lower(): float(row[1])
+                    for row in csv.reader(f_lexicon)
+                    if len(row) >= 2
+                }
+        else:
+            from textblob.en import sentiment as pattern_sentiment
+
+            lexicon = {
+                word: senses.get(None, next(iter(senses.values())))[0]
+                for word, senses in pattern_sentiment.items()
+            }
+
+        # The vocabulary index maps a word to its position in weights.
+        self.vocabulary = pd.Index(list(lexicon.keys()))
+        self.weights = np.fromiter(lexicon.values(), dtype=float, count=len(lexicon))
+        self.negation_index = pd.Index(self.negations)
+
+        digest = hashlib.sha1(
+            repr(sorted(lexicon.items())).encode("utf-8")
+        ).hexdigest()[:8]
+        self.version = f"lexicon-1-{digest}"
+
+    def score(self, cleaned_tweets):
+        count = len(cleaned_tweets)
+        tokens = pd.Series(list(cleaned_tweets), dtype=object).str.lower().str.split()
+        lengths = tokens.str.len().fillna(0).to_numpy(dtype=np.int64)
+        flat_tokens = [token for words in tokens if words for token in words]
+
+        # position of every token in the vocabulary, -1 if it is not there
+        positions = self.vocabulary.get_indexer(flat_tokens)
+        tweet_ids = np.repeat(np.arange(count), lengths)
+
+        weights = np.where(positions >= 0, self.weights[positions], 0.0)
+        negated = np.zeros(len(flat_tokens), dtype=bool)
+        if len(flat_tokens) > 1:
+            is_negation = self.negation_index.get_indexer(flat_tokens) >= 0
+            negated[1:] = is_negation[:-1] & (tweet_ids[1:] == tweet_ids[:-1])
+        weights[negated] *= -0.5
+
+        matched = positions >= 0
+        totals = np.bincount(tweet_ids[matched], weights=weights[matched], minlength=count)
+        matches = np.bincount(tweet_ids[matched], minlength=count)
+
+        sentiments = np.zeros(count, dtype=float)
+        np.divide(totals, matches, out=sentiments, where=matches > 0)
+        return np.clip(sentiments, -1.0, 1.0)
+
+
+BACKENDS = {
+    TextBlobBackend.name: TextBlobBackend,
+    LexiconBackend.name: LexiconBackend,
+}
+
+# one instance of every backend per process
+_INSTANCES = {}
+
+
+def get_backend(name, **kwargs):
+    """
+    Returns the instance of a backend, creating it on first use.
+
+    :param name: name of the backend
+    :type name: str
+    :returns: backend
+    :rtype: SentimentBackend
+
+    :raises: :class:`ValueError`: The backend is not known.
+    """
+    if name not in _INSTANCES:
+        if name not in BACKENDS:
+            raise ValueError(
+                f"Unknown sentiment backend {name}, use one of {', '.join(BACKENDS)}."
+            )
+        _INSTANCES[name] = BACKENDS[name](**kwargs)
+    return _INSTANCES[name]
+
+
+def agreement_report(cleaned_tweets, candidate, reference=None):
+    """
+    Compares the scores of a backend with a reference backend,
+    TextBlob by default, on a corpus of cleaned tweets.
+
+    :param cleaned_tweets: a collection of cleaned strings
+    :type cleaned_tweets: list
+    :param candidate: backend to compare
+    :type candidate: SentimentBackend
+    :param reference: backend to compare with
+    :type reference: SentimentBackend
+    :returns: report
+    :rtype: dict
+    """
+    cleaned_tweets = list(cleaned_tweets)
+    reference = reference or get_backend(TextBlobBackend.name)
+
+    start = time.perf_counter()
+    expected = reference.score(cleaned_tweets)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = candidate.score(cleaned_tweets)
+    candidate_seconds = time.perf_counter() - start
+
+    # The app only separates negative tweets from the others.
+    label_agreement = np.mean((expected < 0) == (actual < 0)) if len(expected) else 1.0
+    sign_agreement = np.mean(np.sign(expected) == np.sign(actual)) if len(expected) else 1.0
+    if len(expected) > 1 and expected.std() > 0 and actual.std() > 0:
+        correlation = float(np.corrcoef(expected, actual)[0, 1])
+    else:
+        correlation = float("nan")
+
+    return {
+        "tweets": len(cleaned_tweets),
+        "reference": reference.name,
+        "candidate": candidate.name,
+        "mean_absolute_error": float(np.mean(np.abs(expected - actual)))
+        if len(expected) else 0.0,
+        "correlation": correlation,
+        "negative_label_agreement": float(label_agreement),
+        "sign_agreement": float(sign_agreement),
+        "reference_seconds": reference_seconds,
+        "candidate_seconds": candidate_seconds,
+        "speedup": reference_seconds / candidate_seconds if candidate_seconds else float("inf"),
+    }
+
+
+# Prints the agreement of the lexicon backend with TextBlob for the
+# tweets of a cached csv file or a text file with a tweet on every line.
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python cx_sentiment_backend.py data/<handle>.csv")
+        sys.exit(1)
+
+    if sys.argv[1].endswith(".csv"):
+        corpus = pd.read_csv(sys.argv[1])["tweets"].astype(str)
+    else:
+        with open(sys.argv[1], "r") as f_corpus:
+            corpus = [line.rstrip("\n") for line in f_corpus]
+
+    from cx_utility import TwitterUtility
+
+    cleaned = TwitterUtility.get_instance().clean_tweets(corpus)
+    for key, value in agreement_report(cleaned, get_backend(LexiconBackend.name)).items():
+        print(f"{key}: {value}")
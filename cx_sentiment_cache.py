@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+"""
+A cache for sentiment scores. Retweets, replies from bots and
+templated answers from support teams repeat the same text, so
+the score for a cleaned tweet is kept and reused instead of
+analysing the text again on every refresh.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from environs import Env
+
+
+class SentimentCache:
+    """
+    A two tier cache of sentiment scores. The first tier is a
+    least recently used dictionary in memory. The second tier is
+    optional and is a SQLite file under data/ so that the scores
+    survive a restart and are shared by all the processes of the app.
+    The entries are keyed by a hash of the cleaned text and the
+    version of the scorer, so a change of scorer does not return
+    old scores.
+
+    :param max_size: maximum number of entries kept in memory
+    :type max_size: int
+    :param persist: keeps a copy of the entries on disk
+    :type persist: bool
+    :param max_disk_size: maximum number of entries kept on disk
+    :type max_disk_size: int
+    :param path: name of the file used for the disk tier
+    :type path: str
+    """
+
+    def __init__(self, max_size=None, persist=None, max_disk_size=None, path=None):
+        env = Env()
+        env.read_env()
+        self.max_size = (
+            env.int("SENTIMENT_CACHE_SIZE", 10000) if max_size is None else max_size
+        )
+        self.persist = (
+            env.bool("SENTIMENT_CACHE_PERSIST", False) if persist is None else persist
+        )
+        self.max_disk_size = (
+            env.int("SENTIMENT_CACHE_DISK_SIZE", 500000)
+            if max_disk_size is None
+            else max_disk_size
+        )
+        self.path = path or env.str("SENTIMENT_CACHE_PATH", "data/sentiment_cache.db")
+
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.logger = logging.getLogger("SentimentCache")
+
+        if self.persist:
+            with self.connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS sentiment "
+                    "(key TEXT PRIMARY KEY, polarity REAL NOT NULL, used REAL NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS sentiment_used ON sentiment (used)"
+                )
+
+    @staticmethod
+    def make_key(text, version):
+        """
+        Creates the key of a cleaned tweet.
+
+        :param text: cleaned tweet
+        :type text: str
+        :param version: version of the scorer
+        :type version: str
+        :returns: key
+        :rtype: str
+        """
+        return hashlib.sha1(f"{version}\0{text}".encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens a connection to the disk tier and commits on success.
+        A connection is opened for every batch, so the cache can be
+        used from any thread or process.
+        """
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def score(self, texts, version, scorer):
+        """
+        Returns the sentiment of every text, in the same order as the
+        texts. Only the texts that are not in either tier are passed
+        to the scorer, and each distinct text is scored once.
+
+        :param texts: cleaned tweets
+        :type texts: list
+        :param version: version of the scorer
+        :type version: str
+        :param scorer: function that takes a list of texts and
+            returns a sequence of polarities
+        :type scorer: callable
+        :returns: sentiments
+        :rtype: ndarray
+        """
+        texts = list(texts)
+        keys = [self.make_key(text, version) for text in texts]
+        found = self.get_many(keys)
+
+        missing = OrderedDict()
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            scored = scorer(list(missing.values()))
+            new_items = dict(zip(missing.keys(), (float(value) for value in scored)))
+            self.put_many(new_items)
+            found.update(new_items)
+
+        self.logger.debug(
+            "Sentiment cache - %d texts, %d scored. %s",
+            len(texts), len(missing), self.stats(),
+        )
+        return np.fromiter((found[key] for key in keys), dtype=float, count=len(keys))
+
+    def get_many(self, keys):
+        """
+        Looks up keys in memory first and then on disk. Entries
+        found on disk are promoted to memory.
+
+        :param keys: keys of cleaned tweets
+        :type keys: list
+        :returns: found
+        :rtype: dict
+        """
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in found:
+                    continue
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+                    self.hits += 1
+
+        not_found = [key for key in dict.fromkeys(keys) if key not in found]
+        if self.persist and not_found:
+            from_disk = self.read_disk(not_found)
+            if from_disk:
+                self.put_memory(from_disk)
+                found.update(from_disk)
+            with self.lock:
+                self.disk_hits += len(from_disk)
+                self.misses += len(not_found) - len(from_disk)
+        else:
+            with self.lock:
+                self.misses += len(not_found)
+
+        return found
+
+    def put_many(self, items):
+        """
+        Adds scores to memory and, if enabled, to disk.
+
+        :param items: scores by key
+        :type items: dict
+        """
+        self.put_memory(items)
+        if self.persist:
+            self.write_disk(items)
+
+    def put_memory(self, items):
+        """
+        Adds scores to the memory tier and evicts the least recently
+        used entries above max_size.
+
+        :param items: scores by key
+        :type items: dict
+        """
+        with self.lock:
+            for key, value in items.items():
+                self.memory[key] = value
+                self.memory.move_to_end(key)
+            while len(self.memory) > self.max_size:
+                self.memory.popitem(last=False)
+
+    def read_disk(self, keys):
+        """
+        Reads scores from the disk tier and marks them as used.
+
+        :param keys: keys of cleaned tweets
+        :type keys: list
+        :returns: found
+        :rtype: dict
+        """
+        found = {}
+        now = time.time()
+        with self.connect() as connection:
+            # SQLite limits the number of parameters of a statement.
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = connection.execute(
+                    "SELECT key, polarity FROM sentiment WHERE key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                ).fetchall()
+                found.update(rows)
+            connection.executemany(
+                "UPDATE sentiment SET used = ? WHERE key = ?",
+                [(now, key) for key in found],
+            )
+        return found
+
+    def write_disk(self, items):
+        """
+        Writes scores to the disk tier and removes the least
+        recently used entries above max_disk_size.
+
+        :param items: scores by key
+        :type items: dict
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO sentiment (key, polarity, used) VALUES (?, ?, ?)",
+                [(key, value, now) for key, value in items.items()],
+            )
+            connection.execute(
+                "DELETE FROM sentiment WHERE key IN (SELECT key FROM sentiment "
+                "ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_size,),
+            )
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        :returns: stats
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self.memory),
+            }
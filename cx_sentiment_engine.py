@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+"""
+Scoring of sentiment for large batches of tweets. Scoring is
+CPU bound, so large batches are split into chunks and scored
+by a pool of processes. Small batches are scored in the calling
+process as starting work in other processes costs more than it saves.
+"""
+import itertools
+import logging
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from environs import Env
+
+from cx_sentiment_backend import get_backend
+
+
+def score_chunk(cleaned_tweets, backend_name):
+    """
+    Scores a chunk of cleaned tweets with a backend. It is a
+    module level function so that it can be sent to a worker process,
+    where the backend is created on first use.
+
+    :param cleaned_tweets: a collection of cleaned strings
+    :type cleaned_tweets: list
+    :param backend_name: name of the sentiment backend
+    :type backend_name: str
+    :returns: sentiments
+    :rtype: ndarray
+    """
+    return get_backend(backend_name).score(cleaned_tweets)
+
+
+class SentimentEngine:
+    """
+    Scores batches of cleaned tweets either serially or with a
+    process pool. The pool is started on first use and reused
+    for every batch after that. The output is always in the same
+    order as the input.
+
+    :param workers: number of worker processes, parallel
+        scoring is disabled below two
+    :type workers: int
+    :param min_batch: smallest batch that is scored in parallel
+    :type min_batch: int
+    :param chunk_size: number of tweets sent to a worker at once,
+        zero spreads a batch evenly over the workers
+    :type chunk_size: int
+    :param backend: name of the sentiment backend
+    :type backend: str
+    """
+
+    def __init__(self, workers=None, min_batch=None, chunk_size=None, backend=None):
+        env = Env()
+        env.read_env()
+        self.backend = get_backend(
+            env.str("SENTIMENT_BACKEND", "textblob") if backend is None else backend
+        )
+        self.workers = env.int("SENTIMENT_WORKERS", 0) if workers is None else workers
+        self.min_batch = (
+            env.int("SENTIMENT_PARALLEL_MIN_BATCH", 500)
+            if min_batch is None
+            else min_batch
+        )
+        self.chunk_size = (
+            env.int("SENTIMENT_CHUNK_SIZE", 0) if chunk_size is None else chunk_size
+        )
+
+        self.executor = None
+        self.executor_pid = None
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("SentimentEngine")
+
+    def get_executor(self):
+        """
+        Returns the process pool and creates one if there is none
+        yet. A pool inherited from a parent process is not used.
+        """
+        with self.lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                self.executor_pid = os.getpid()
+                self.logger.info("Started %d sentiment workers.", self.workers)
+            return self.executor
+
+    def shutdown(self):
+        """
+        Stops the process pool, if there is one.
+        """
+        with self.lock:
+            if self.executor is not None and self.executor_pid == os.getpid():
+                self.executor.shutdown()
+            self.executor = None
+
+    def score(self, cleaned_tweets):
+        """
+        Scores a batch of cleaned tweets.
+
+        :param cleaned_tweets: a collection of cleaned strings
+        :type cleaned_tweets: list
+        :returns: sentiments
+        :rtype: ndarray
+        """
+        cleaned_tweets = list(cleaned_tweets)
+        count = len(cleaned_tweets)
+
+        if self.workers < 2 or count < self.min_batch:
+            return self.backend.score(cleaned_tweets)
+
+        size = self.chunk_size or math.ceil(count / self.workers)
+        chunks = [
+            cleaned_tweets[start:start + size] for start in range(0, count, size)
+        ]
+        try:
+            results = self.get_executor().map(
+                score_chunk, chunks, itertools.repeat(self.backend.name)
+            )
+            sentiments = np.fromiter(
+                itertools.chain.from_iterable(results), dtype=float, count=count
+            )
+        except BrokenProcessPool as identifier:
+            self.logger.error("Sentiment workers failed, scoring serially - %s", identifier)
+            self.shutdown()
+            sentiments = self.backend.score(cleaned_tweets)
+
+        self.logger.debug("Scored %d tweets in %d chunks.", count, len(chunks))
+        return sentiments
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+"""
+Coalesces calls for the same key, so only one fetch of a twitter
+handle runs at a time. Threads of the same process wait for the
+running call and share its result. Processes are serialised with a
+lock file under data/locks, and can skip the work if another process
+has just done it.
+"""
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # file locks are not available on Windows
+    fcntl = None
+
+
+class _Call:
+    """
+    A call in flight and its outcome.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time.
+
+    :param lock_dir: directory of the lock files
+    :type lock_dir: str
+    """
+
+    def __init__(self, lock_dir="data/locks"):
+        self.lock_dir = lock_dir
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.logger = logging.getLogger("SingleFlight")
+
+    @contextmanager
+    def file_lock(self, key):
+        """
+        Holds an exclusive lock on the lock file of a key, which
+        blocks the same key in other processes.
+
+        :param key: key of the call
+        :type key: str
+        """
+        if fcntl is None:
+            yield
+            return
+
+        os.makedirs(self.lock_dir, exist_ok=True)
+        file = os.path.join(self.lock_dir, re.sub(r"[^\w.-]", "_", key) + ".lock")
+        with open(file, "a") as f_lock:
+            fcntl.flock(f_lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f_lock, fcntl.LOCK_UN)
+
+    def do(self, key, function, check=None):
+        """
+        Calls a function, unless a call for the same key is already
+        running in this process. In that case the result of the
+        running call is returned, or its exception is raised.
+
+        :param key: key of the call
+        :type key: str
+        :param function: function without arguments
+        :type function: callable
+        :param check: called once the lock is held, if it returns
+            something other than None the work was done by another
+            process and the function is not called
+        :type check: callable
+        :returns: result of the function or the check
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+
+        if not leader:
+            self.logger.debug("Waiting for the call in flight for %s.", key)
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            with self.file_lock(key):
+                result = check() if check is not None else None
+                if result is None:
+                    result = function()
+                else:
+                    self.logger.debug("Call for %s done by another process.", key)
+                call.result = result
+        except Exception as identifier:
+            call.error = identifier
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+        return call.result
@@ -0,0 +1,663 @@
+#!/usr/bin/python3
+"""
+Storage of the tweets of twitter handles, in the format selected
+by TWEET_STORE. Csv is the default. Feather and parquet are columnar
+binary formats with typed columns, they are read without text parsing
+and can load only the columns that are needed. Both need pyarrow.
+These formats have one file per handle under data/. The sqlite
+format keeps all the handles in one indexed database, which can
+also answer queries across handles.
+
+Existing files can be migrated from one format to another:
+python cx_storage.py migrate feather
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from environs import Env
+
+from cx_cache_manager import DataCacheManager
+
+
+# Columns of the stored tweets and their types. The types are as
+# small as the data allows, the source of a tweet is one of a few
+# apps and is kept as a category.
+TWEET_SCHEMA = {
+    "tweets": "object",
+    "id": "int64",
+    "date": "datetime64[ns]",
+    "source": "category",
+    "likes": "int32",
+    "sentiment": "float32",
+}
+
+
+def tweet_length(df_tweets):
+    """
+    Returns the number of characters of each tweet.
+    """
+    return df_tweets["tweets"].str.len().fillna(0).astype("int32")
+
+
+# Columns that are not stored, but computed from the stored columns
+# when they are needed, e.g. only for the rows of a page.
+DERIVED_COLUMNS = {
+    "len": (tweet_length, ["tweets"]),
+}
+
+# Files in data/ that are not tweets of a twitter handle.
+RESERVED_NAMES = {"users_valid", "users_invalid"}
+
+
+def apply_schema(df_tweets, columns=None):
+    """
+    Selects the columns of the schema, in the order of the schema,
+    and converts them to their types.
+
+    :param df_tweets: tweets
+    :type df_tweets: DataFrame
+    :param columns: columns to keep, all the columns of the schema by default
+    :type columns: list
+    :returns: df_tweets
+    :rtype: DataFrame
+    """
+    columns = [column for column in TWEET_SCHEMA if columns is None or column in columns]
+    df_tweets = df_tweets.reindex(columns=columns)
+    for column in columns:
+        dtype = TWEET_SCHEMA[column]
+        if dtype.startswith("int"):
+            df_tweets[column] = df_tweets[column].fillna(0).astype(dtype)
+        elif dtype.startswith("datetime64"):
+            df_tweets[column] = pd.to_datetime(df_tweets[column])
+        else:
+            df_tweets[column] = df_tweets[column].astype(dtype)
+    return df_tweets.reset_index(drop=True)
+
+
+def add_derived_columns(df_tweets, columns):
+    """
+    Adds the derived columns among columns to the tweets, for
+    example the length of the tweets.
+
+    :param df_tweets: tweets with the columns the derived columns need
+    :type df_tweets: DataFrame
+    :param columns: columns wanted
+    :type columns: list
+    :returns: df_tweets, a new frame if a column was added
+    :rtype: DataFrame
+    """
+    derived = {
+        column: DERIVED_COLUMNS[column][0](df_tweets)
+        for column in columns
+        if column in DERIVED_COLUMNS and column not in df_tweets
+    }
+    return df_tweets.assign(**derived) if derived else df_tweets
+
+
+def merge_tweets(df_existing, df_new, retention_days=0, retention_count=0):
+    """
+    Adds new tweets to the tweets already stored. Tweets are
+    deduplicated by id, the newer copy is kept, and sorted from
+    the latest. Tweets outside of the retention window are removed.
+
+    :param df_existing: tweets stored
+    :type df_existing: DataFrame
+    :param df_new: tweets fetched
+    :type df_new: DataFrame
+    :param retention_days: days of tweets kept, counted from the
+        latest tweet, zero keeps all
+    :type retention_days: int
+    :param retention_count: maximum number of tweets kept, zero keeps all
+    :type retention_count: int
+    :returns: df_tweets
+    :rtype: DataFrame
+    """
+    df_tweets = pd.concat([df_existing, df_new], ignore_index=True)
+    df_tweets = df_tweets.drop_duplicates(subset="id", keep="last")
+    df_tweets = df_tweets.sort_values("id", ascending=False)
+
+    if retention_days > 0 and not df_tweets.empty:
+        oldest = df_tweets["date"].max() - pd.Timedelta(days=retention_days)
+        df_tweets = df_tweets[df_tweets["date"] >= oldest]
+    if retention_count > 0:
+        df_tweets = df_tweets.head(retention_count)
+
+    # the categories of the two frames are combined again
+    return apply_schema(df_tweets)
+
+
+class TweetStore:
+    """
+    Interface of a storage format. There is one file per twitter
+    handle, so the age of the data is the modification time of
+    the file. Files are written atomically and the least recently
+    read files are removed when data/ is over its budget.
+
+    :param path: directory of the files
+    :type path: str
+    """
+
+    name = None
+    extension = None
+
+    def __init__(self, path="data/"):
+        self.path = path
+        self.cache_manager = DataCacheManager(path, [self.extension], RESERVED_NAMES)
+
+    def file(self, user):
+        """
+        Returns the name of the file of a twitter handle.
+        """
+        return os.path.join(self.path, user + self.extension)
+
+    def key(self, user):
+        """
+        Returns the key of the data of a twitter handle. Two spellings
+        of a handle with the same key share their data, so a fetch
+        of one of them can stand in for the other. The file names
+        are case sensitive, so the key is the file.
+        """
+        return self.file(user)
+
+    def exists(self, user):
+        """
+        Checks if there is data for a twitter handle.
+        """
+        return os.path.isfile(self.file(user))
+
+    def mtime(self, user):
+        """
+        Returns the time the data of a twitter handle was last
+        written, as a timestamp, or None if there is no data.
+        """
+        try:
+            return os.path.getmtime(self.file(user))
+        except FileNotFoundError:
+            return None
+
+    def version(self, user):
+        """
+        Returns a value that changes whenever the data of a twitter
+        handle is written.
+
+        :raises: :class:`FileNotFoundError`: There is no data for the handle.
+        """
+        stat = os.stat(self.file(user))
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def touch(self, user, mtime=None):
+        """
+        Sets the time the data of a twitter handle was last written,
+        to now by default, without writing it.
+        """
+        os.utime(self.file(user), None if mtime is None else (mtime, mtime))
+
+    def record_access(self, user):
+        """
+        Records that the data of a twitter handle was read, which
+        keeps it from being removed.
+        """
+        self.cache_manager.record_access(self.file(user))
+
+    def users(self):
+        """
+        Returns the twitter handles that have data.
+        """
+        users = []
+        for file in sorted(glob.glob(os.path.join(self.path, "*" + self.extension))):
+            user = os.path.basename(file)[: -len(self.extension)]
+            if user not in RESERVED_NAMES:
+                users.append(user)
+        return users
+
+    def read(self, user, columns=None):
+        """
+        Reads the tweets of a twitter handle.
+
+        :param user: twitter handle
+        :type user: str
+        :param columns: columns to read, all by default
+        :type columns: list
+        :returns: df_tweets
+        :rtype: DataFrame
+
+        :raises: :class:`FileNotFoundError`: There is no data for the handle.
+        """
+        raise NotImplementedError
+
+    def write(self, user, df_tweets):
+        """
+        Replaces the tweets of a twitter handle.
+
+        :param user: twitter handle
+        :type user: str
+        :param df_tweets: tweets
+        :type df_tweets: DataFrame
+        """
+        raise NotImplementedError
+
+    def merge(self, user, df_new, retention_days=0, retention_count=0):
+        """
+        Adds new tweets to the tweets of a twitter handle, see
+        merge_tweets.
+
+        :param user: twitter handle
+        :type user: str
+        :param df_new: tweets fetched
+        :type df_new: DataFrame
+        :param retention_days: days of tweets kept, zero keeps all
+        :type retention_days: int
+        :param retention_count: maximum number of tweets kept, zero keeps all
+        :type retention_count: int
+        """
+        if self.exists(user):
+            df_new = merge_tweets(
+                self.read(user), df_new, retention_days, retention_count
+            )
+        self.write(user, df_new)
+
+    def remove(self, user):
+        """
+        Removes the tweets of a twitter handle.
+        """
+        os.remove(self.file(user))
+
+
+class CsvStore(TweetStore):
+    """
+    Tweets as text in a csv file. Files written before the schema
+    was added have an unnamed index column, which is ignored.
+    """
+
+    name = "csv"
+    extension = ".csv"
+
+    def read(self, user, columns=None):
+        wanted = set(columns or TWEET_SCHEMA)
+        df_tweets = pd.read_csv(
+            self.file(user),
+            usecols=lambda column: column in wanted,
+            parse_dates=["date"] if "date" in wanted else False,
+        )
+        return apply_schema(df_tweets, columns)
+
+    def write(self, user, df_tweets):
+        with self.cache_manager.atomic_file(self.file(user)) as temp_file:
+            apply_schema(df_tweets).to_csv(temp_file, index=False)
+
+
+class FeatherStore(TweetStore):
+    """
+    Tweets in an Arrow IPC (feather) file. The file is memory
+    mapped, so reading the columns needed is close to zero copy.
+    """
+
+    name = "feather"
+    extension = ".feather"
+
+    def __init__(self, path="data/"):
+        super().__init__(path)
+        # fails early if the optional dependency is missing
+        from pyarrow import feather
+
+        self.feather = feather
+
+    def read(self, user, columns=None):
+        columns = [column for column in TWEET_SCHEMA if columns is None or column in columns]
+        table = self.feather.read_table(self.file(user), columns=columns, memory_map=True)
+        return table.to_pandas()
+
+    def write(self, user, df_tweets):
+        with self.cache_manager.atomic_file(self.file(user)) as temp_file:
+            self.feather.write_feather(apply_schema(df_tweets), temp_file)
+
+
+class ParquetStore(TweetStore):
+    """
+    Tweets in a compressed parquet file.
+    """
+
+    name = "parquet"
+    extension = ".parquet"
+
+    def __init__(self, path="data/"):
+        super().__init__(path)
+        # fails early if the optional dependency is missing
+        import pyarrow
+        from pyarrow import parquet
+
+        self.pyarrow = pyarrow
+        self.parquet = parquet
+
+    def read(self, user, columns=None):
+        columns = [column for column in TWEET_SCHEMA if columns is None or column in columns]
+        table = self.parquet.read_table(self.file(user), columns=columns, memory_map=True)
+        return table.to_pandas()
+
+    def write(self, user, df_tweets):
+        table = self.pyarrow.Table.from_pandas(apply_schema(df_tweets), preserve_index=False)
+        with self.cache_manager.atomic_file(self.file(user)) as temp_file:
+            self.parquet.write_table(table, temp_file)
+
+
+class SqliteStore(TweetStore):
+    """
+    Tweets of all the twitter handles in one SQLite database,
+    data/tweets.db. Tweets are keyed by id and indexed by handle
+    and date and by handle and sentiment. New tweets are upserted
+    in one transaction, and the database runs in WAL mode so pages
+    can read while tweets are written. Handles are stored in lower
+    case, as twitter handles are not case sensitive. The database
+    is not limited by the budget of data/, so the store has no
+    cache manager.
+    """
+
+    name = "sqlite"
+    extension = ".db"
+    date_format = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, path="data/"):
+        self.path = path
+        self.cache_manager = None
+        self.database = os.path.join(path, "tweets" + self.extension)
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tweets ("
+                "id INTEGER PRIMARY KEY, handle TEXT NOT NULL, tweets TEXT, "
+                "date TEXT, source TEXT, likes INTEGER, sentiment REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS tweets_handle_date ON tweets (handle, date)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS tweets_handle_sentiment "
+                "ON tweets (handle, sentiment)"
+            )
+            # when the tweets of a handle were last fetched
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS handles ("
+                "handle TEXT PRIMARY KEY, updated REAL NOT NULL, version INTEGER NOT NULL)"
+            )
+
+    @contextmanager
+    def connect(self):
+        """
+        Opens a connection to the database and commits on success.
+        """
+        connection = sqlite3.connect(self.database, timeout=30)
+        try:
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def file(self, user):
+        return self.database
+
+    def key(self, user):
+        return user.lower()
+
+    def record_access(self, user):
+        pass
+
+    def handle_row(self, user):
+        """
+        Returns the update time and version of a twitter handle.
+        """
+        with self.connect() as connection:
+            return connection.execute(
+                "SELECT updated, version FROM handles WHERE handle = ?", (user.lower(),)
+            ).fetchone()
+
+    def exists(self, user):
+        return self.handle_row(user) is not None
+
+    def mtime(self, user):
+        row = self.handle_row(user)
+        return None if row is None else row[0]
+
+    def version(self, user):
+        row = self.handle_row(user)
+        if row is None:
+            raise FileNotFoundError(f"No tweets stored for {user}.")
+        return tuple(row)
+
+    def touch(self, user, mtime=None):
+        with self.connect() as connection:
+            self.mark_updated(connection, user, mtime)
+
+    def users(self):
+        with self.connect() as connection:
+            return [
+                row[0]
+                for row in connection.execute("SELECT handle FROM handles ORDER BY handle")
+            ]
+
+    def read(self, user, columns=None):
+        columns = [column for column in TWEET_SCHEMA if columns is None or column in columns]
+        if not self.exists(user):
+            raise FileNotFoundError(f"No tweets stored for {user}.")
+        with self.connect() as connection:
+            df_tweets = pd.read_sql_query(
+                f"SELECT {', '.join(columns)} FROM tweets WHERE handle = ? ORDER BY id DESC",
+                connection,
+                params=(user.lower(),),
+            )
+        return apply_schema(df_tweets, columns)
+
+    def write(self, user, df_tweets):
+        with self.connect() as connection:
+            connection.execute("DELETE FROM tweets WHERE handle = ?", (user.lower(),))
+            self.upsert(connection, user, df_tweets)
+            self.mark_updated(connection, user)
+
+    def merge(self, user, df_new, retention_days=0, retention_count=0):
+        handle = user.lower()
+        with self.connect() as connection:
+            self.upsert(connection, user, df_new)
+            if retention_days > 0:
+                connection.execute(
+                    "DELETE FROM tweets WHERE handle = ? AND date < "
+                    "(SELECT datetime(MAX(date), ?) FROM tweets WHERE handle = ?)",
+                    (handle, f"-{retention_days} days", handle),
+                )
+            if retention_count > 0:
+                connection.execute(
+                    "DELETE FROM tweets WHERE handle = ? AND id NOT IN "
+                    "(SELECT id FROM tweets WHERE handle = ? ORDER BY id DESC LIMIT ?)",
+                    (handle, handle, retention_count),
+                )
+            self.mark_updated(connection, user)
+
+    def remove(self, user):
+        with self.connect() as connection:
+            connection.execute("DELETE FROM tweets WHERE handle = ?", (user.lower(),))
+            connection.execute("DELETE FROM handles WHERE handle = ?", (user.lower(),))
+
+    def upsert(self, connection, user, df_tweets):
+        """
+        Inserts tweets in one batch, replacing the tweets with the same id.
+        """
+        df_tweets = apply_schema(df_tweets)
+        df_tweets["date"] = df_tweets["date"].dt.strftime(self.date_format)
+        df_tweets.insert(1, "handle", user.lower())
+        columns = list(df_tweets.columns)
+        connection.executemany(
+            f"INSERT INTO tweets ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            "ON CONFLICT(id) DO UPDATE SET "
+            + ", ".join(f"{column} = excluded.{column}" for column in columns[1:]),
+            df_tweets.astype(object).itertuples(index=False, name=None),
+        )
+
+    @staticmethod
+    def mark_updated(connection, user, mtime=None):
+        """
+        Records when the tweets of a twitter handle were written.
+        """
+        connection.execute(
+            "INSERT INTO handles (handle, updated, version) VALUES (?, ?, 1) "
+            "ON CONFLICT(handle) DO UPDATE SET updated = excluded.updated, "
+            "version = version + 1",
+            (user.lower(), time.time() if mtime is None else mtime),
+        )
+
+    def query(self, handles=None, since=None, until=None, max_sentiment=None,
+              columns=None):
+        """
+        Reads tweets of several twitter handles at once, for
+        example all the negative tweets of the last day.
+
+        :param handles: twitter handles, all by default
+        :type handles: list
+        :param since: earliest date of the tweets
+        :type since: datetime
+        :param until: latest date of the tweets, excluded
+        :type until: datetime
+        :param max_sentiment: highest sentiment of the tweets, excluded
+        :type max_sentiment: float
+        :param columns: columns to read, all by default
+        :type columns: list
+        :returns: df_tweets, with a handle column
+        :rtype: DataFrame
+        """
+        columns = [column for column in TWEET_SCHEMA if columns is None or column in columns]
+        conditions, params = self.conditions(handles, since, until)
+        if max_sentiment is not None:
+            conditions.append("sentiment < ?")
+            params.append(max_sentiment)
+
+        with self.connect() as connection:
+            df_tweets = pd.read_sql_query(
+                f"SELECT handle, {', '.join(columns)} FROM tweets "
+                f"WHERE {' AND '.join(conditions)} ORDER BY date DESC",
+                connection,
+                params=params,
+            )
+        handle = df_tweets.pop("handle")
+        df_tweets = apply_schema(df_tweets, columns)
+        df_tweets.insert(0, "handle", handle)
+        return df_tweets
+
+    def summary(self, handles=None, since=None, until=None):
+        """
+        Aggregates the sentiment of tweets by twitter handle.
+
+        :param handles: twitter handles, all by default
+        :type handles: list
+        :param since: earliest date of the tweets
+        :type since: datetime
+        :param until: latest date of the tweets, excluded
+        :type until: datetime
+        :returns: summary, one row per handle
+        :rtype: DataFrame
+        """
+        conditions, params = self.conditions(handles, since, until)
+        with self.connect() as connection:
+            return pd.read_sql_query(
+                "SELECT handle, COUNT(*) AS tweets, AVG(sentiment) AS sentiment, "
+                "SUM(sentiment < 0) AS negative, MAX(date) AS latest FROM tweets "
+                f"WHERE {' AND '.join(conditions)} GROUP BY handle ORDER BY handle",
+                connection,
+                params=params,
+                parse_dates=["latest"],
+            )
+
+    def conditions(self, handles, since, until):
+        """
+        Builds the conditions of a query on handles and dates.
+        """
+        conditions, params = ["1 = 1"], []
+        if handles:
+            conditions.append(f"handle IN ({', '.join('?' * len(handles))})")
+            params.extend(handle.lower() for handle in handles)
+        if since is not None:
+            conditions.append("date >= ?")
+            params.append(since.strftime(self.date_format))
+        if until is not None:
+            conditions.append("date < ?")
+            params.append(until.strftime(self.date_format))
+        return conditions, params
+
+
+STORES = {
+    CsvStore.name: CsvStore,
+    FeatherStore.name: FeatherStore,
+    ParquetStore.name: ParquetStore,
+    SqliteStore.name: SqliteStore,
+}
+
+
+def get_store(name=None, path="data/"):
+    """
+    Creates the store selected by name or by TWEET_STORE.
+
+    :param name: name of the storage format
+    :type name: str
+    :param path: directory of the files
+    :type path: str
+    :returns: store
+    :rtype: TweetStore
+
+    :raises: :class:`ValueError`: The format is not known.
+    :raises: :class:`ImportError`: pyarrow is needed and not installed.
+    """
+    if name is None:
+        env = Env()
+        env.read_env()
+        name = env.str("TWEET_STORE", CsvStore.name)
+    if name not in STORES:
+        raise ValueError(f"Unknown tweet store {name}, use one of {', '.join(STORES)}.")
+    return STORES[name](path)
+
+
+def migrate(source, target, remove=False):
+    """
+    Copies the tweets of all the twitter handles from one store to
+    another. The modification time is kept, so the data is not
+    considered fresher than it is.
+
+    :param source: store to copy from
+    :type source: TweetStore
+    :param target: store to copy to
+    :type target: TweetStore
+    :param remove: removes the files of the source store
+    :type remove: bool
+    :returns: users
+    :rtype: list
+    """
+    users = source.users()
+    for user in users:
+        mtime = source.mtime(user)
+        target.write(user, source.read(user))
+        if mtime is not None:
+            target.touch(user, mtime)
+        if remove:
+            source.remove(user)
+    return users
+
+
+# Migrates the stored tweets to another format.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate stored tweets.")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("target", choices=sorted(STORES))
+    parser.add_argument("--source", choices=sorted(STORES), default=CsvStore.name)
+    parser.add_argument("--path", default="data/")
+    parser.add_argument("--remove", action="store_true", help="remove the source files")
+    arguments = parser.parse_args()
+
+    migrated = migrate(
+        get_store(arguments.source, arguments.path),
+        get_store(arguments.target, arguments.path),
+        arguments.remove,
+    )
+    print(f"Migrated {len(migrated)} twitter handles to {arguments.target}.")
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+"""
+An index of the negative tweets of twitter handles that a contact
+centre should respond to first. A tweet is ranked by the severity
+of its sentiment, its likes and how recent it is:
+
+    score = severity * (1 + likes) ** likes_weight * 0.5 ** (age / half_life)
+
+The age is the only part of the score that changes with time and it
+changes the same way for every tweet, so the order of the tweets
+does not change. The index keeps the logarithm of the score without
+the current time as the rank of a tweet, and only the best tweets of
+a twitter handle in a heap. New tweets are pushed on the heap after
+each fetch, without sorting all the tweets again.
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+
+from environs import Env
+
+
+# Columns of the tweets kept in the index.
+TRIAGE_COLUMNS = ["tweets", "id", "date", "source", "likes", "sentiment"]
+
+
+class TriageIndex:
+    """
+    Keeps the highest ranked negative tweets of each twitter handle.
+
+    :param capacity: number of tweets kept for a twitter handle
+    :type capacity: int
+    :param likes_weight: weight of the likes of a tweet in its score
+    :type likes_weight: float
+    :param half_life_hours: hours for the score of a tweet to halve
+    :type half_life_hours: float
+    """
+
+    def __init__(self, capacity=None, likes_weight=None, half_life_hours=None):
+        env = Env()
+        env.read_env()
+        self.capacity = env.int("TRIAGE_CAPACITY", 100) if capacity is None else capacity
+        self.likes_weight = (
+            env.float("TRIAGE_LIKES_WEIGHT", 1.0) if likes_weight is None else likes_weight
+        )
+        half_life_hours = (
+            env.float("TRIAGE_HALF_LIFE_HOURS", 24) if half_life_hours is None else half_life_hours
+        )
+        # decay of the logarithm of the score per second
+        self.decay = math.log(2) / (half_life_hours * 3600)
+
+        # handle -> (version, latest id, heap of (rank, id, tweet))
+        self.handles = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger("TriageIndex")
+
+    def rank(self, sentiment, likes, timestamp):
+        """
+        Returns the rank of a negative tweet, the logarithm of its
+        score plus the decay up to the current time.
+
+        :param sentiment: sentiment of the tweet, below zero
+        :type sentiment: float
+        :param likes: likes of the tweet
+        :type likes: int
+        :param timestamp: time of the tweet in seconds since the epoch
+        :type timestamp: float
+        :returns: rank
+        :rtype: float
+        """
+        return (
+            math.log(-sentiment)
+            + self.likes_weight * math.log1p(max(likes, 0))
+            + self.decay * timestamp
+        )
+
+    def push(self, heap, df_tweets):
+        """
+        Pushes the negative tweets of a frame on a heap, keeping
+        the heap within the capacity.
+
+        :param heap: heap of (rank, id, tweet)
+        :type heap: list
+        :param df_tweets: tweets
+        :type df_tweets: DataFrame
+        """
+        df_negative = df_tweets[df_tweets["sentiment"] < 0]
+        df_negative = df_negative[df_negative["date"].notna()]
+        timestamps = df_negative["date"].values.astype("datetime64[s]").astype("int64")
+
+        for tweet, timestamp in zip(
+            df_negative[TRIAGE_COLUMNS].itertuples(index=False), timestamps
+        ):
+            entry = (
+                self.rank(float(tweet.sentiment), int(tweet.likes), int(timestamp)),
+                int(tweet.id),
+                tweet._asdict(),
+            )
+            if len(heap) < self.capacity:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    def sync(self, handle, version, load):
+        """
+        Brings the index of a twitter handle up to date with its
+        stored tweets. Only the tweets newer than the latest tweet
+        in the index are added. If tweets were removed from the store,
+        the index is built again only when one of them was in the
+        index, as a tweet left out earlier may take its place.
+
+        :param handle: twitter handle
+        :type handle: str
+        :param version: version of the stored tweets
+        :type version: tuple
+        :param load: function without arguments that loads the tweets
+        :type load: callable
+        """
+        with self.lock:
+            state = self.handles.get(handle)
+            if state is not None and state[0] == version:
+                return
+
+            df_tweets = load()
+            if len(df_tweets) == 0:
+                self.handles[handle] = (version, None, [])
+                return
+
+            last_id = int(df_tweets["id"].max())
+            oldest_id = int(df_tweets["id"].min())
+
+            heap = None
+            if state is not None and state[1] is not None and last_id >= state[1]:
+                heap = state[2]
+                if heap and min(entry[1] for entry in heap) < oldest_id:
+                    heap = None
+
+            if heap is None:
+                heap = []
+                self.push(heap, df_tweets)
+                self.logger.debug("Built the index of %s.", handle)
+            else:
+                self.push(heap, df_tweets[df_tweets["id"] > state[1]])
+                self.logger.debug("Updated the index of %s.", handle)
+
+            self.handles[handle] = (version, last_id, heap)
+
+    def top(self, handle, k):
+        """
+        Returns the k highest ranked negative tweets of a twitter
+        handle with their current score, the highest first.
+
+        :param handle: twitter handle
+        :type handle: str
+        :param k: number of tweets
+        :type k: int
+        :returns: tweets
+        :rtype: list
+        """
+        with self.lock:
+            state = self.handles.get(handle)
+            entries = heapq.nlargest(k, state[2]) if state else []
+
+        now = time.time()
+        tweets = []
+        for rank, _, tweet in entries:
+            tweet = dict(tweet)
+            tweet["score"] = math.exp(rank - self.decay * now)
+            tweets.append(tweet)
+        return tweets
+
+    def invalidate(self, handle):
+        """
+        Removes the index of a twitter handle.
+        """
+        with self.lock:
+            self.handles.pop(handle, None)
@@ -5,16 +5,25 @@ in local file and validations is here.
 """
 import re
 import logging
+import math
 import os
+import threading
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
 
-from textblob import TextBlob
-
 from environs import Env
 
+from cx_frame_cache import FrameCache
+from cx_handle_index import HandleIndex
+from cx_metrics import DATA_CACHE, RATE_LIMITED, STAGE_SECONDS, TWEETS_SCORED
+from cx_rate_limit import RateLimiter
+from cx_sentiment_cache import SentimentCache
+from cx_sentiment_engine import SentimentEngine
+from cx_storage import get_store
+from cx_triage import TriageIndex, TRIAGE_COLUMNS
+
 class CustomerExperienceException(Exception):
     """
     Defining a customised exception
@@ -25,18 +34,34 @@ class CustomerExperienceException(Exception):
     using these functions.
     """
 
+class RateLimitExceeded(CustomerExperienceException):
+    """
+    Raised when a rate limit budget is used up. The flask app
+    responds with 429 Too Many Requests and a Retry-After header.
+
+    :param budget: name of the budget
+    :type budget: str
+    :param retry_after: seconds to wait before trying again
+    :type retry_after: float
+    """
+
+    def __init__(self, budget, retry_after):
+        super().__init__(
+            f"Too many requests for {budget} - please try again in {math.ceil(retry_after)} seconds."
+        )
+        self.budget = budget
+        self.retry_after = retry_after
+
 class TwitterUtility:
 
     """
-    A class to keep track of the number of calls for data, to avoid
+    A class to keep track of the rate of calls for data, to avoid
     too many requests when tested on a public server. This class uses
     Singleton pattern of object oriented programming. There is only
     one instance of the class.
-    How would this count help? It helps to avoid too many requests
-    for user_search or data_search for small scale application and
-    the API has a rate limit. To get the right config
-    values, rate limit should be known and the rate limit should be
-    combined with time window.
+    How would the rate limits help? The API has a rate limit, and the
+    budgets of the API calls and of the page views are shared by all
+    the processes of the app, see cx_rate_limit.
     This class also has function for analysing and categorizing
     contents from tweets. The following regex just strips of an
     URL (not just http), any punctuations, User Names or Any
@@ -46,6 +71,7 @@ class TwitterUtility:
 
     # the single instance of class
     __instance = None
+    __instance_lock = threading.Lock()
 
     @staticmethod
     def get_instance():
@@ -54,8 +80,9 @@ class TwitterUtility:
         creates one if there is no instance of class exists. To get the
         instance TrackingSingleton.get_instance() method should be used.
         """
-        if TwitterUtility.__instance is None:
-            TwitterUtility()
+        with TwitterUtility.__instance_lock:
+            if TwitterUtility.__instance is None:
+                TwitterUtility()
 
         return TwitterUtility.__instance
 
@@ -70,8 +97,23 @@ class TwitterUtility:
                 "This class is a singleton for tracking, use getInstance()!"
             )
 
-        self.user_search_count = 0
-        self.data_search_count = 0
+        # compiled USER_CLEAN_REGEX, loaded on first use
+        self.clean_regex = None
+
+        env = Env()
+        env.read_env()
+        # How much history is kept for a twitter handle. The days are
+        # counted back from the latest tweet and zero keeps everything.
+        self.retention_days = env.int("TWEET_RETENTION_DAYS", 30)
+        self.retention_count = env.int("TWEET_RETENTION_COUNT", 0)
+        # Files younger than the max age are fresh. Older files can
+        # still be served while they are refreshed in the background,
+        # up to the max staleness. Zero staleness always fetches first.
+        self.cache_max_age_hours = env.float("CACHE_MAX_AGE_HOURS", 12)
+        self.cache_max_staleness_hours = env.float("CACHE_MAX_STALENESS_HOURS", 0)
+
+        self.sentiment_cache = SentimentCache()
+        self.sentiment_engine = SentimentEngine()
         # A logger is used to avoid writing everything to screen and
         # it is easier to identify issues.
         logging.basicConfig(
@@ -85,31 +127,44 @@ class TwitterUtility:
         logging.info("POC - Utility")
 
         self.logger = logging.getLogger("Utility")
+        self.handle_index = HandleIndex()
+        self.frame_cache = FrameCache()
+        self.triage_index = TriageIndex()
+        self.store = get_store()
+        self.rate_limiter = RateLimiter()
         TwitterUtility.__instance = self
 
-    def get_user_search_count(self):
+    def acquire_rate_limit(self, budget, tokens=1):
         """
-        A getter method to get the current user_search_count.
-        """
-        return self.user_search_count
+        Takes tokens from a rate limit budget, upstream for the
+        calls to the API or page_views for the pages showing data.
 
-    def get_data_search_count(self):
-        """
-        A getter method to get data search count.
-        """
-        return self.data_search_count
+        :param budget: name of the budget
+        :type budget: str
+        :param tokens: number of calls
+        :type tokens: int
 
-    def set_user_search_count(self):
+        :raises: :class:`RateLimitExceeded`: The budget is used up.
         """
-        A setter method that will increment the count of user_search.
-        """
-        self.user_search_count += 1
+        retry_after = self.rate_limiter.acquire(budget, tokens)
+        if retry_after:
+            RATE_LIMITED.inc(budget=budget)
+            raise RateLimitExceeded(budget, retry_after)
 
-    def set_data_search_count(self):
+    def get_clean_regex(self):
         """
-        A setter method that will increment the count of data_search.
+        Loads USER_CLEAN_REGEX from the environment and compiles it.
+        The compiled pattern is kept on the instance, so the .env
+        file is only read once and not for every tweet.
+
+        :returns: clean_regex
+        :rtype: Pattern
         """
-        self.data_search_count += 1
+        if self.clean_regex is None:
+            env = Env()
+            env.read_env()
+            self.clean_regex = re.compile(os.getenv("USER_CLEAN_REGEX"))
+        return self.clean_regex
 
     def tweet_remove_special_char_and_hyperlink(self, tweet):
         """
@@ -118,13 +173,31 @@ class TwitterUtility:
         :param tweet: a string of words.
         :type tweet: str
         """
-        env = Env()
-        env.read_env()
-        cleaned_tweet = " ".join(re.sub(
-            os.getenv("USER_CLEAN_REGEX"), " ", tweet).split())
-        self.logger.debug("Cleaned tweet %s.", cleaned_tweet)
+        cleaned_tweet = " ".join(self.get_clean_regex().sub(" ", tweet).split())
         return cleaned_tweet
 
+    def clean_tweets(self, tweets):
+        """
+        Strips characters from a whole column of tweets at once.
+        The result is the same as calling
+        tweet_remove_special_char_and_hyperlink on every tweet,
+        but the string operations are vectorised by pandas.
+
+        :param tweets: a collection of strings
+        :type tweets: Series or list
+        :returns: cleaned_tweets
+        :rtype: Series
+        """
+        cleaned_tweets = (
+            pd.Series(tweets, dtype=object)
+            .astype(str)
+            .str.replace(self.get_clean_regex(), " ", regex=True)
+            .str.split()
+            .str.join(" ")
+        )
+        self.logger.debug("Cleaned %d tweets.", len(cleaned_tweets))
+        return cleaned_tweets
+
     def analyse_sentiment(self, tweet):
         """
         Analysing the sentiment of a tweet.
@@ -136,88 +209,271 @@ class TwitterUtility:
         :returns: sentiment
         :rtype: float
         """
-        analysis = TextBlob(self.tweet_remove_special_char_and_hyperlink(tweet))
-        return analysis.sentiment.polarity
+        return float(self.analyse_sentiment_batch([tweet])[0])
+
+    def analyse_sentiment_batch(self, tweets):
+        """
+        Analysing the sentiment of a batch of tweets. The
+        tweets are cleaned together and the polarities are
+        returned in the same order as the tweets. Scores of
+        tweets seen before are taken from the sentiment cache.
+
+        :param tweets: a collection of strings
+        :type tweets: Series or list
+        :returns: sentiments
+        :rtype: ndarray
+        """
+        cleaned_tweets = self.clean_tweets(tweets)
+        return self.sentiment_cache.score(
+            cleaned_tweets,
+            self.sentiment_engine.backend.version,
+            self.sentiment_engine.score,
+        )
 
+    @STAGE_SECONDS.time(stage="score")
     def tweets_to_data_frame(self, tweets):
         """
         Converts tweets to tabular structure with
         rows and columns. Most of the data is returned
         from the API. The only additional column added
-        is sentiment.
+        is sentiment. The columns have the types of
+        TWEET_SCHEMA in cx_storage.
 
         :param tweets: a collection of tweets
         :type tweets: list
         :returns: df_tweets
         :rtype: DataFrame
         """
-        df_tweets = pd.DataFrame(data=[tweet.text for tweet in tweets], columns=["tweets"])
-        df_tweets["id"] = np.array([tweet.id for tweet in tweets])
-        df_tweets["len"] = np.array([len(tweet.text) for tweet in tweets])
-        df_tweets["date"] = np.array([tweet.created_at for tweet in tweets])
-        df_tweets["source"] = np.array([tweet.source for tweet in tweets])
-        df_tweets["likes"] = np.array([tweet.favorite_count for tweet in tweets])
-        df_tweets["sentiment"] = np.array(
-            [self.analyse_sentiment(tweet) for tweet in df_tweets["tweets"]]
+        # Each column is built with its type in one pass over the
+        # tweets, instead of going through a list of Python objects.
+        count = len(tweets)
+        df_tweets = pd.DataFrame({
+            "tweets": pd.Series([tweet.text for tweet in tweets], dtype="object"),
+            "id": np.fromiter((tweet.id for tweet in tweets), dtype=np.int64, count=count),
+            "date": pd.to_datetime([tweet.created_at for tweet in tweets]),
+            "source": pd.Categorical([tweet.source for tweet in tweets]),
+            "likes": np.fromiter(
+                (tweet.favorite_count for tweet in tweets), dtype=np.int32, count=count
+            ),
+        })
+        df_tweets["sentiment"] = np.asarray(
+            self.analyse_sentiment_batch(df_tweets["tweets"]), dtype=np.float32
         )
+        TWEETS_SCORED.inc(count)
         return df_tweets
 
+    @STAGE_SECONDS.time(stage="cache_check")
     def is_data_in_cache(self, user):
         """
         Collects tweets for a twitter handle or user and
         stores it as a file. To avoid too many connections
         to the external API, the files are cached locally
-        on the server. They are refreshed after twelve hours.
+        on the server. They are refreshed after twelve hours,
+        or CACHE_MAX_AGE_HOURS.
         The file is only refreshed if there is request for
         the data in file belonging to a twitter handle. The
-        files should be deleted frequently as it is unnecessary
-        to store it other than using for caching purpose.
+        files that were not read for the longest time are deleted
+        when data/ is over DATA_CACHE_MAX_MB or DATA_CACHE_MAX_FILES.
 
         :param user: twitter handle
         :type user: str
 
         """
-        path = "data/"
-        file = path + user + ".csv"
         valid = False
+        age_hours = self.get_cache_age_hours(user)
 
-        file_exists = os.path.isfile(file)
-
-        if file_exists:
-            utc_time = datetime.utcfromtimestamp(os.path.getmtime(file))
-
-            today_time = datetime.utcnow()
-            diff_day_delta = today_time - utc_time
+        if age_hours is not None:
             # if the file has been there for more than 12 hours, create it again.
-            if diff_day_delta.total_seconds() / 60 / 60 < 12:
+            if age_hours < self.cache_max_age_hours:
                 self.logger.debug(
-                    "File exists but it is more than an 12 hours old -> \
-                    Fetching the file again to get latest data. "
+                    "Files exists and is less than an 12 hours, not fetching it for now."
                 )
                 valid = True
             else:
                 self.logger.debug(
-                    "Files exists and is less than an 12 hours, not fetching it for now."
+                    "File exists but it is more than an 12 hours old -> \
+                    Fetching the file again to get latest data. "
                 )
         else:
             self.logger.debug("File does not exist. It has to be fetched.")
 
+        DATA_CACHE.inc(result="hit" if valid else "miss")
         return valid
 
+    def get_cache_age_hours(self, user):
+        """
+        Returns the number of hours since the file of a twitter
+        handle was written, or None if there is no file.
+
+        :param user: twitter handle
+        :type user: str
+        :returns: age_hours
+        :rtype: float
+        """
+        mtime = self.store.mtime(user)
+        if mtime is None:
+            return None
+
+        utc_time = datetime.utcfromtimestamp(mtime)
+        today_time = datetime.utcnow()
+        diff_day_delta = today_time - utc_time
+        return diff_day_delta.total_seconds() / 60 / 60
+
+    def is_stale_data_usable(self, user):
+        """
+        Checks if the file of a twitter handle is out of date, but
+        not older than the max staleness. Such a file can be served
+        while it is refreshed in the background.
+
+        :param user: twitter handle
+        :type user: str
+        :returns: usable
+        :rtype: bool
+        """
+        age_hours = self.get_cache_age_hours(user)
+        return (
+            age_hours is not None
+            and self.cache_max_age_hours <= age_hours < self.cache_max_staleness_hours
+        )
+
+    def get_latest_tweet_id(self, user):
+        """
+        Returns the id of the latest tweet stored for a twitter
+        handle, so only newer tweets have to be fetched.
+
+        :param user: twitter handle
+        :type user: str
+        :returns: latest_id
+        :rtype: int
+        """
+        latest_id = None
+
+        if self.store.exists(user):
+            try:
+                ids = self.store.read(user, columns=["id"])["id"]
+                if not ids.empty:
+                    latest_id = int(ids.max())
+            except ValueError as identifier:
+                self.logger.error("Could not read tweet ids of %s - %s", user, identifier)
+
+        return latest_id
+
     def save_data(self, user, tweets):
         """
-        A method to fetch data and write to a csv file.
+        A method to write tweets to the store, a csv file by
+        default. The tweets are added to the tweets already stored.
+        If there are no new tweets, the data is only marked as fresh.
+
+        :param user: twitter handle
+        :type user: str
+        :param tweets: a collection of tweets
+        :type tweets: list
+        """
+        data_exists = self.store.exists(user)
+
+        if data_exists and len(tweets) == 0:
+            self.store.touch(user)
+            self.logger.debug("No new tweets for %s.", user)
+            return
+
+        self.save_data_frame(user, self.tweets_to_data_frame(tweets))
+
+    def save_data_frame(self, user, df_tweets, retention=True, triage=True):
+        """
+        Adds tweets that are already scored, see tweets_to_data_frame,
+        to the tweets stored for a twitter handle.
+
+        :param user: twitter handle
+        :type user: str
+        :param df_tweets: tweets
+        :type df_tweets: DataFrame
+        :param retention: removes the tweets outside of TWEET_RETENTION_DAYS
+            and TWEET_RETENTION_COUNT, turned off to backfill history
+        :type retention: bool
+        :param triage: updates the triage index, which reads the tweets
+            of the handle back, turned off to save many batches in a row
+            and call sync_triage once at the end
+        :type triage: bool
+        """
+        # the tweets are scored before, see the score stage
+        with STAGE_SECONDS.time(stage="save"):
+            if retention:
+                self.store.merge(user, df_tweets, self.retention_days, self.retention_count)
+            else:
+                self.store.merge(user, df_tweets)
+        self.logger.debug("Saved %d new tweets for %s.", len(df_tweets), user)
+        if triage:
+            self.sync_triage(user)
+
+    def has_data(self, user):
+        """
+        Checks if there is stored data for a twitter handle.
+
+        :param user: twitter handle
+        :type user: str
+        :returns: data_exists
+        :rtype: bool
+        """
+        return self.store.exists(user)
+
+    @STAGE_SECONDS.time(stage="load")
+    def load_data(self, user, columns=None):
+        """
+        Reads the tweets of a twitter handle from the store.
+        The tweets are cached in memory until the stored data
+        changes, so the frame must not be modified in place.
+
+        :param user: twitter handle
+        :type user: str
+        :param columns: columns to read, all by default
+        :type columns: list
+        :returns: df_tweets
+        :rtype: DataFrame
+
+        :raises: :class:`FileNotFoundError`: There is no data for the handle.
+        :raises: :class:`ValueError`: The data can not be parsed.
+        """
+        key = (self.store.name, user, tuple(columns) if columns else None)
+        self.store.record_access(user)
+        return self.frame_cache.get(
+            key,
+            self.store.version(user),
+            lambda: self.store.read(user, columns),
+        )
+
+    def sync_triage(self, user):
+        """
+        Adds the new tweets of a twitter handle to its triage index.
 
         :param user: twitter handle
         :type user: str
-        :param file: name of the file
-        :type file: str
+
+        :raises: :class:`FileNotFoundError`: There is no data for the handle.
+        :raises: :class:`ValueError`: The data can not be parsed.
         """
-        path = "data/"
-        file = path + user + ".csv"
+        self.triage_index.sync(
+            user,
+            self.store.version(user),
+            lambda: self.load_data(user, TRIAGE_COLUMNS),
+        )
 
-        df_tweets = self.tweets_to_data_frame(tweets)
-        df_tweets.to_csv(file)
+    def get_triage(self, user, k):
+        """
+        Returns the negative tweets of a twitter handle that should
+        be responded to first, see cx_triage.
+
+        :param user: twitter handle
+        :type user: str
+        :param k: number of tweets
+        :type k: int
+        :returns: tweets with their score, the highest first
+        :rtype: list
+
+        :raises: :class:`FileNotFoundError`: There is no data for the handle.
+        :raises: :class:`ValueError`: The data can not be parsed.
+        """
+        self.sync_triage(user)
+        return self.triage_index.top(user, k)
 
     def validate_user_in_list(self, user):
         """
@@ -235,27 +491,22 @@ class TwitterUtility:
 
         :raises: :class:`CustomerExperienceException`: Connection to API fails.
         """
-        user_valid = False
-
-        # first check for user in local file
-        with open("data/users_valid.csv", "r") as f_val_user:
-            data = f_val_user.readlines()
-
-            for line in data:
-                if line.capitalize().rstrip() == user.capitalize().rstrip():
-                    user_valid = True
-                    self.logger.debug("user in valid list")
-                    return user_valid
+        return self.lookup_user(user) is True
 
-        with open("data/users_invalid.csv", "r") as f_inv_user:
-            data = f_inv_user.readlines()
-
-            for line in data:
-                if line.capitalize().rstrip() == user.capitalize().rstrip():
-                    user_valid = False
-                    self.logger.debug("user in invalid list")
-                    return user_valid
+    def lookup_user(self, user):
+        """
+        Looks up a twitter user in the valid and invalid lists,
+        which are indexed in memory. Entries expire after
+        HANDLE_VALID_TTL_HOURS or HANDLE_INVALID_TTL_HOURS.
 
+        :param user: twitter handle
+        :type user: str
+        :returns: True if valid, False if invalid, None if unknown
+        :rtype: bool
+        """
+        user_valid = self.handle_index.lookup(user)
+        if user_valid is not None:
+            self.logger.debug("user in %s list", "valid" if user_valid else "invalid")
         return user_valid
 
     def write_to_user_list(self, user, valid):
@@ -269,11 +520,8 @@ class TwitterUtility:
         :param valid: indicates the validity of user
         :type file: bool
         """
+        self.handle_index.add(user, valid)
         if valid:
-            with open("data/users_valid.csv", "a") as f_valid_user:
-                f_valid_user.writelines(user + "\n")
             self.logger.debug("Added %s to valid list.", user)
         else:
-            with open("data/users_invalid.csv", "a") as f_invalid_user:
-                f_invalid_user.writelines(user + "\n")
             self.logger.debug("Added %s to invalid list.", user)
@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+"""
+Warms the cache of tweets before the pages are visited, so the
+first page views are served from the cache. The tweets of every
+twitter handle in a list are fetched, scored and stored, a few
+handles at a time. The calls to the API are taken from the shared
+upstream rate limit budget, and the command waits when the budget
+is used up. Tweets can also be read from recorded JSON lines, one
+file per handle, instead of the API.
+
+python cx_warm.py --handles data/users_valid.csv --workers 4
+python cx_warm.py --source dump --dump-dir data/dumps
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tweepy import TweepError
+
+from cx_form_handler import SINGLE_FLIGHT, TwitterAPI
+from cx_records import open_jsonl, read_jsonl, write_jsonl
+from cx_utility import CustomerExperienceException, RateLimitExceeded, TwitterUtility
+
+
+class StageStats:
+    """
+    Number of tweets and time spent in each stage of the warm up,
+    added up over the threads, to report the throughput of the stages.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def add(self, stage, items, seconds):
+        """
+        Adds the tweets processed by a stage and the time it took.
+
+        :param stage: name of the stage
+        :type stage: str
+        :param items: number of tweets
+        :type items: int
+        :param seconds: time taken
+        :type seconds: float
+        """
+        with self.lock:
+            total_items, total_seconds = self.stages.get(stage, (0, 0.0))
+            self.stages[stage] = (total_items + items, total_seconds + seconds)
+
+    def report(self):
+        """
+        Returns a line per stage with its throughput.
+
+        :returns: lines
+        :rtype: list
+        """
+        with self.lock:
+            return [
+                f"{stage:<6} {items:>9} tweets {seconds:>9.2f} s "
+                f"{items / seconds if seconds else 0.0:>10.1f} tweets/s"
+                for stage, (items, seconds) in self.stages.items()
+            ]
+
+
+def read_handles(path):
+    """
+    Reads a list of twitter handles, one per line. Anything after
+    a comma, like the time of the check in the valid list, is
+    ignored. Duplicates, empty lines and lines starting with # are
+    skipped. Spellings of a handle that differ in case are kept, as
+    their data is stored apart by the file stores.
+
+    :param path: name of the file
+    :type path: str
+    :returns: handles
+    :rtype: list
+    """
+    with open(path, "r") as f_handles:
+        handles = (line.partition(",")[0].strip() for line in f_handles)
+        return list(dict.fromkeys(
+            handle for handle in handles if handle and not handle.startswith("#")
+        ))
+
+
+def dump_file(dump_dir, handle):
+    """
+    Returns the name of the recorded tweets of a twitter handle,
+    <handle>.jsonl or <handle>.jsonl.gz.
+
+    :raises: :class:`FileNotFoundError`: There are no recorded tweets.
+    """
+    for name in (f"{handle}.jsonl", f"{handle}.jsonl.gz"):
+        path = os.path.join(dump_dir, name)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No recorded tweets for {handle} in {dump_dir}.")
+
+
+def download_tweets(api, handle, max_wait):
+    """
+    Fetches the new tweets of a twitter handle, waiting for the
+    rate limit budget when it is used up.
+
+    :param api: twitter client
+    :type api: TwitterAPI
+    :param handle: twitter handle
+    :type handle: str
+    :param max_wait: most seconds to wait for the budget
+    :type max_wait: float
+    :returns: tweets
+    :rtype: list
+
+    :raises: :class:`RateLimitExceeded`: The budget is not available in time.
+    """
+    waited = 0.0
+    while True:
+        try:
+            return api.download_tweets(handle)
+        except RateLimitExceeded as identifier:
+            if waited + identifier.retry_after > max_wait:
+                raise
+            time.sleep(identifier.retry_after)
+            waited += identifier.retry_after
+
+
+def warm_handle(handle, arguments, stats):
+    """
+    Fetches, scores and stores the tweets of a twitter handle,
+    unless its data is fresh. A fetch of the same handle by the
+    app at the same time is shared.
+
+    :param handle: twitter handle
+    :type handle: str
+    :param arguments: options of the command
+    :type arguments: argparse.Namespace
+    :param stats: throughput of the stages
+    :type stats: StageStats
+    :returns: number of tweets, None if the data was fresh
+    :rtype: int
+    """
+    cx_utility = TwitterUtility.get_instance()
+
+    def warm():
+        start = time.perf_counter()
+        if arguments.source == "api":
+            tweets = download_tweets(TwitterAPI.get_instance(), handle, arguments.max_wait)
+            if arguments.record_dir:
+                with open(os.path.join(arguments.record_dir, f"{handle}.jsonl"), "a") as f_dump:
+                    write_jsonl(tweets, f_dump)
+        else:
+            with open_jsonl(dump_file(arguments.dump_dir, handle)) as f_dump:
+                tweets = list(read_jsonl(f_dump))
+        stats.add("fetch", len(tweets), time.perf_counter() - start)
+
+        if not tweets:
+            cx_utility.save_data(handle, tweets)
+            return 0
+
+        start = time.perf_counter()
+        df_tweets = cx_utility.tweets_to_data_frame(tweets)
+        stats.add("score", len(tweets), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        cx_utility.save_data_frame(handle, df_tweets)
+        stats.add("write", len(tweets), time.perf_counter() - start)
+        return len(tweets)
+
+    def is_fresh():
+        return True if cx_utility.is_data_in_cache(handle) else None
+
+    count = SINGLE_FLIGHT.do(
+        "tweets-" + cx_utility.store.key(handle), warm, check=None if arguments.force else is_fresh
+    )
+    return None if count is True else count
+
+
+def main():
+    """
+    Warms the cache of the twitter handles of a list.
+    """
+    parser = argparse.ArgumentParser(description="Fetch, score and store tweets ahead of time.")
+    parser.add_argument("--handles", default="data/users_valid.csv",
+                        help="file with a twitter handle per line")
+    parser.add_argument("--source", choices=["api", "dump"], default="api")
+    parser.add_argument("--dump-dir", default="data/dumps",
+                        help="recorded tweets, <handle>.jsonl, for --source dump")
+    parser.add_argument("--record-dir",
+                        help="appends the tweets fetched from the API to <handle>.jsonl")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="twitter handles warmed at the same time")
+    parser.add_argument("--max-wait", type=float, default=900,
+                        help="most seconds to wait for the rate limit budget per handle")
+    parser.add_argument("--force", action="store_true", help="warm fresh handles as well")
+    arguments = parser.parse_args()
+
+    if arguments.record_dir:
+        os.makedirs(arguments.record_dir, exist_ok=True)
+
+    handles = read_handles(arguments.handles)
+    stats = StageStats()
+    start = time.perf_counter()
+
+    def warm(handle):
+        # a handle that fails, e.g. without API keys, a connection or
+        # budget, is reported and the other handles are still warmed
+        try:
+            return handle, warm_handle(handle, arguments, stats), None
+        except (CustomerExperienceException, FileNotFoundError, TweepError,
+                ValueError) as identifier:
+            return handle, None, identifier
+
+    warmed = fresh = tweets = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(arguments.workers, 1)) as executor:
+        for handle, count, error in executor.map(warm, handles):
+            if error is not None:
+                failed.append(handle)
+                print(f"{handle}: failed - {error}")
+            elif count is None:
+                fresh += 1
+                print(f"{handle}: fresh")
+            else:
+                warmed += 1
+                tweets += count
+                print(f"{handle}: {count} tweets")
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Warmed {warmed} twitter handles with {tweets} tweets in {elapsed:.2f} s, "
+        f"{fresh} fresh, {len(failed)} failed."
+    )
+    for line in stats.report():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Fixtures of the tests. The app keeps its data under data/ of the
+working directory, so every test runs in a directory of its own
+with fresh instances of the utility and the twitter client. The
+twitter API is replaced by a fake timeline.
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("USER_CLEAN_REGEX", r"(@[A-Za-z0-9]+)|([^0-9A-Za-z \t])|(\w+:\/\/\S+)")
+for key in ("CONSUMER_KEY", "CONSUMER_SECRET", "ACCESS_TOKEN", "ACCESS_TOKEN_SECRET"):
+    os.environ.setdefault(key, "test")
+os.environ.setdefault("TWEET_RETENTION_DAYS", "0")
+
+WORDS = "good bad terrible great awful happy sad service slow fast love hate delivery".split()
+
+
+class FakeTweet:
+    """
+    A tweet of a fake timeline, with the attributes used by the app.
+    """
+
+    def __init__(self, handle, number):
+        rnd = random.Random(f"{handle}-{number}")
+        self.id = 1300000000000000000 + number
+        self.text = " ".join(rnd.choice(WORDS) for _ in range(8)) + " http://t.co/x"
+        self.created_at = datetime(2020, 1, 1) + timedelta(hours=number)
+        self.source = rnd.choice(["Twitter for iPhone", "Twitter Web App"])
+        self.favorite_count = rnd.randint(0, 20)
+
+
+class FakeUser:
+    """
+    A twitter user returned by get_user.
+    """
+
+    def __init__(self, handle):
+        self.id_str = "1"
+        self.screen_name = handle
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs a test in an empty directory with a data/ directory and
+    new instances of the utility and the twitter client.
+    """
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    import cx_form_handler
+    import cx_utility
+
+    monkeypatch.setattr(cx_utility.TwitterUtility, "_TwitterUtility__instance", None)
+    monkeypatch.setattr(cx_form_handler.TwitterAPI, "_TwitterAPI__instance", None)
+    return tmp_path
+
+
+@pytest.fixture
+def fake_twitter(monkeypatch):
+    """
+    Replaces the timeline and the users of the twitter API. Handles
+    starting with bad are not valid. Returns the calls made to the API.
+    """
+    import tweepy
+
+    calls = []
+
+    def user_timeline(self, *args, **kwargs):
+        handle = kwargs["screen_name"]
+        calls.append(("user_timeline", handle))
+        since_id = kwargs.get("since_id") or 0
+        tweets = [FakeTweet(handle, number) for number in range(59, -1, -1)]
+        return [tweet for tweet in tweets if tweet.id > since_id][: kwargs.get("count", 20)]
+
+    def get_user(self, handle, *args, **kwargs):
+        calls.append(("get_user", handle))
+        if handle.lower().startswith("bad"):
+            raise tweepy.TweepError("User not found")
+        return FakeUser(handle)
+
+    monkeypatch.setattr(tweepy.API, "user_timeline", user_timeline)
+    monkeypatch.setattr(tweepy.API, "get_user", get_user)
+    return calls
+
+
+@pytest.fixture
+def client(workdir, fake_twitter):
+    """
+    A test client of the app, with the rendered plots forgotten.
+    """
+    import cx_flask
+    import cx_plot
+
+    cx_plot.RENDER_CACHE.plots.clear()
+    app = cx_flask.create_app(preload_modules=False)
+    app.testing = True
+    app.config["WTF_CSRF_ENABLED"] = False
+    return app.test_client()
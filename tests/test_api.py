@@ -0,0 +1,32 @@
+"""
+Tests of the JSON API.
+"""
+import pytest
+
+from conftest import FakeTweet
+
+
+@pytest.fixture
+def stored(client):
+    """
+    Fetches and stores the tweets of a twitter handle.
+    """
+    from cx_form_handler import TwitterAPI
+
+    TwitterAPI.get_instance().get_tweets("Coles")
+    return client
+
+
+def test_ids_are_strings(stored):
+    page = stored.get("/api/tweets/Coles?limit=5").get_json()
+
+    assert [tweet["id"] for tweet in page["tweets"]] == [
+        str(FakeTweet("Coles", number).id) for number in range(59, 54, -1)
+    ]
+    assert page["next_cursor"] == page["tweets"][-1]["id"]
+
+    next_page = stored.get(f"/api/tweets/Coles?limit=5&cursor={page['next_cursor']}").get_json()
+    assert next_page["tweets"][0]["id"] == str(FakeTweet("Coles", 54).id)
+
+    triage = stored.get("/api/triage/Coles?k=3").get_json()
+    assert all(isinstance(tweet["id"], str) for tweet in triage["tweets"])
@@ -0,0 +1,53 @@
+"""
+Tests of the atomic writes and the eviction of files under data/.
+"""
+import os
+import time
+from types import SimpleNamespace
+
+import cx_cache_manager
+from cx_cache_manager import DataCacheManager
+
+
+def write(manager, file, text):
+    """
+    Writes a file with atomic_file.
+    """
+    with manager.atomic_file(file) as temp_file:
+        with open(temp_file, "w") as f_data:
+            f_data.write(text)
+
+
+def test_record_access_keeps_the_mtime_of_a_file_replaced_meanwhile(workdir, monkeypatch):
+    manager = DataCacheManager("data/")
+    file = os.path.join("data", "Coles.csv")
+    write(manager, file, "old\n")
+    old_mtime = time.time() - 86400
+    os.utime(file, (old_mtime, old_mtime))
+
+    def time_ns():
+        # a writer replaces the file while its access is recorded
+        write(manager, file, "new\n")
+        return time.time_ns()
+
+    monkeypatch.setattr(
+        cx_cache_manager, "time", SimpleNamespace(time_ns=time_ns, monotonic=time.monotonic)
+    )
+    manager.record_access(file)
+
+    with open(file) as f_data:
+        assert f_data.read() == "new\n"
+    assert os.stat(file).st_mtime > old_mtime + 3600
+
+
+def test_record_access_sets_the_access_time_only(workdir):
+    manager = DataCacheManager("data/")
+    file = os.path.join("data", "Coles.csv")
+    write(manager, file, "tweets\n")
+    os.utime(file, (1000000000, 1000000000))
+
+    manager.record_access(file)
+
+    stat = os.stat(file)
+    assert stat.st_mtime == 1000000000
+    assert stat.st_atime > 1000000000
@@ -0,0 +1,110 @@
+"""
+Tests of the pages of the app.
+"""
+import pytest
+
+
+@pytest.fixture
+def stored(client):
+    """
+    Fetches and stores the tweets of two twitter handles.
+    """
+    from cx_form_handler import TwitterAPI
+
+    api = TwitterAPI.get_instance()
+    for handle in ("Coles", "woolworths"):
+        api.get_tweets(handle)
+    return client
+
+
+def test_display_is_streamed_a_chunk_of_rows_at_a_time(stored, monkeypatch):
+    import cx_flask
+
+    monkeypatch.setattr(cx_flask, "STREAM_CHUNK_ROWS", 10)
+    response = stored.get("/display/Coles/woolworths", buffered=False)
+    chunks = [chunk.decode("utf-8") for chunk in response.iter_encoded()]
+    response.close()
+
+    assert response.status_code == 200
+    # the plot is sent before the tweet tables
+    assert "Sentiment Analysis Comparison" in chunks[0]
+    assert "</html>" not in chunks[0]
+    rows = [chunk.count("</tr>") for chunk in chunks[1:-1]]
+    assert 10 in rows and all(count <= 10 + 1 for count in rows)
+    assert "".join(chunks) == stored.get("/display/Coles/woolworths?stream=0").data.decode("utf-8")
+
+
+def test_profiled_display_covers_the_tweet_tables(stored, monkeypatch):
+    import cx_flask
+
+    rendered = []
+    render_template = cx_flask.render_template
+
+    def spy_render_template(template_name, **context):
+        rendered.append(template_name)
+        return render_template(template_name, **context)
+
+    monkeypatch.setattr(cx_flask, "METRICS_PROFILING", True)
+    monkeypatch.setattr(cx_flask, "render_template", spy_render_template)
+    response = stored.get("/display/Coles/woolworths?profile=1")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    # the page is rendered in full while the profiler runs
+    assert rendered == ["cust_support_competition.html"]
+
+
+def test_display_shows_the_error_page_before_streaming(stored, monkeypatch):
+    from cx_utility import TwitterUtility
+
+    cx_utility = TwitterUtility.get_instance()
+    load_data = cx_utility.load_data
+
+    def load_data_without_source(user, columns=None):
+        df_tweets = load_data(user, columns)
+        return df_tweets if columns else df_tweets.drop(columns="source")
+
+    monkeypatch.setattr(cx_utility, "load_data", load_data_without_source)
+    response = stored.get("/display/Coles/woolworths")
+
+    assert response.status_code == 200
+    assert b"There is no data available" in response.data
+    assert b"Sentiment Analysis Comparison" not in response.data
+
+
+def test_nothing_is_fetched_when_a_handle_is_invalid(client, fake_twitter):
+    response = client.post(
+        "/customerxp", data={"twitter_handle": "Coles", "competitors_twitter_handle": "badguy"}
+    )
+
+    assert b"Twitter handle badguy is not valid!" in response.data
+    assert sorted(fake_twitter) == [("get_user", "Coles"), ("get_user", "badguy")]
+
+
+def test_valid_handles_are_fetched_after_the_validation(client, fake_twitter):
+    response = client.post(
+        "/customerxp", data={"twitter_handle": "Coles", "competitors_twitter_handle": "woolworths"}
+    )
+
+    assert response.status_code == 302
+    assert sorted(call for call in fake_twitter if call[0] == "user_timeline") == [
+        ("user_timeline", "Coles"), ("user_timeline", "woolworths")
+    ]
+
+
+@pytest.mark.parametrize("store, handles", [
+    ("csv", ["Coles", "coles", "woolworths"]),
+    ("sqlite", ["Coles", "woolworths"]),
+])
+def test_compare_form_keeps_the_spellings_the_store_keeps_apart(workdir, monkeypatch,
+                                                                store, handles):
+    import cx_flask
+    from cx_flask_form import CompareHandlesForm
+
+    monkeypatch.setenv("TWEET_STORE", store)
+    app = cx_flask.create_app(preload_modules=False)
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.test_request_context(
+            "/compare", method="POST", data={"twitter_handles": "Coles, coles\nwoolworths, Coles"}
+    ):
+        assert CompareHandlesForm().get_handles() == handles
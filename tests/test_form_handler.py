@@ -0,0 +1,45 @@
+"""
+Tests of the calls to the twitter API.
+"""
+import os
+import threading
+
+import tweepy
+
+
+def test_spellings_of_a_handle_do_not_share_a_fetch(workdir, fake_twitter, monkeypatch):
+    from cx_form_handler import TwitterAPI
+
+    entered = threading.Event()
+    release = threading.Event()
+    user_timeline = tweepy.API.user_timeline
+
+    def slow_user_timeline(self, *args, **kwargs):
+        if kwargs["screen_name"] == "Coles1":
+            entered.set()
+            release.wait(5)
+        return user_timeline(self, *args, **kwargs)
+
+    monkeypatch.setattr(tweepy.API, "user_timeline", slow_user_timeline)
+    api = TwitterAPI.get_instance()
+
+    leader = threading.Thread(target=api.get_tweets, args=("Coles1",))
+    leader.start()
+    assert entered.wait(5)
+
+    # the csv files are case sensitive, so coles1 is fetched on its own
+    follower = threading.Thread(target=api.get_tweets, args=("coles1",))
+    follower.start()
+    follower.join(5)
+    release.set()
+    leader.join(5)
+
+    assert os.path.isfile("data/Coles1.csv")
+    assert os.path.isfile("data/coles1.csv")
+
+
+def test_sqlite_store_shares_the_data_of_spellings(workdir):
+    from cx_storage import CsvStore, SqliteStore
+
+    assert CsvStore().key("Coles") != CsvStore().key("coles")
+    assert SqliteStore().key("Coles") == SqliteStore().key("coles")
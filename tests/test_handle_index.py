@@ -0,0 +1,85 @@
+"""
+Tests of the index of the valid and invalid twitter handles.
+"""
+import time
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+
+import cx_handle_index
+from cx_handle_index import HandleIndex
+
+
+@pytest.fixture
+def index(workdir, monkeypatch):
+    """
+    An index of empty lists that reads new lines on every lookup.
+    The clock moves a second every time it is read, so every check
+    of a handle is later than the previous one.
+    """
+    seconds = count(time.time())
+    monkeypatch.setattr(
+        cx_handle_index,
+        "time",
+        SimpleNamespace(time=lambda: float(next(seconds)), monotonic=time.monotonic),
+    )
+    monkeypatch.setenv("HANDLE_INDEX_CHECK_SECONDS", "0")
+    monkeypatch.setenv("HANDLE_INVALID_TTL_HOURS", "1")
+    return HandleIndex()
+
+
+def test_entries_keep_their_age_when_the_lists_are_read_again(index):
+    with open("data/users_invalid.csv", "a") as f_user:
+        f_user.write(f"expired,{time.time() - 7200:.3f}\n")
+        f_user.write("legacy\n")
+    index.add("Recent", False)
+
+    reloaded = HandleIndex()
+    assert reloaded.lookup("expired") is None
+    assert reloaded.lookup("legacy") is None
+    assert reloaded.lookup("recent") is False
+
+
+def test_the_latest_check_of_a_handle_wins(index):
+    index.add("Coles", True)
+    index.add("coles", False)
+    assert index.lookup("Coles") is False
+    assert HandleIndex().lookup("Coles") is False
+
+    index.add("COLES", True)
+    assert index.lookup("Coles") is True
+    assert HandleIndex().lookup("Coles") is True
+
+
+def test_compact_keeps_the_latest_check(index):
+    index.add("Coles", True)
+    index.add("Coles", False)
+    index.add("Aldi", False)
+    index.add("Aldi", True)
+    index.compact()
+
+    with open("data/users_valid.csv") as f_user:
+        assert [line.split(",")[0] for line in f_user] == ["Aldi"]
+    with open("data/users_invalid.csv") as f_user:
+        assert [line.split(",")[0] for line in f_user] == ["Coles"]
+
+
+def test_added_lines_are_not_counted_again(index):
+    for _ in range(3):
+        index.add("Coles", True)
+    index.add("Aldi", False)
+    index.lookup("Coles")
+
+    assert index.lines == {True: 3, False: 1}
+    assert index.positions[True] == len(open("data/users_valid.csv", "rb").read())
+
+
+def test_lines_of_other_processes_are_read(index):
+    index.add("Coles", True)
+    other = HandleIndex()
+    other.add("Aldi", True)
+    index.add("woolworths", True)
+
+    assert index.lookup("Aldi") is True
+    assert index.lines[True] == 3
@@ -0,0 +1,95 @@
+"""
+Tests of the ingest of JSON lines.
+"""
+import json
+
+from conftest import FakeTweet
+
+
+def tweet_lines(handle, count):
+    """
+    Returns the tweets of a fake timeline as JSON lines.
+    """
+    lines = []
+    for number in range(count):
+        tweet = FakeTweet(handle, number)
+        lines.append(json.dumps({
+            "id": tweet.id,
+            "text": tweet.text,
+            "created_at": tweet.created_at.strftime("%a %b %d %H:%M:%S +0000 %Y"),
+            "source": tweet.source,
+            "favorite_count": tweet.favorite_count,
+            "user": {"screen_name": handle},
+        }))
+    return lines
+
+
+def test_ingest_syncs_the_triage_index_once_per_handle(workdir, monkeypatch):
+    from cx_ingest import ingest
+    from cx_utility import TwitterUtility
+
+    cx_utility = TwitterUtility.get_instance()
+    synced = []
+    sync_triage = cx_utility.sync_triage
+    monkeypatch.setattr(
+        cx_utility, "sync_triage", lambda user: synced.append(user) or sync_triage(user)
+    )
+
+    lines = tweet_lines("Coles", 50) + tweet_lines("Aldi", 30)
+    counts = ingest(lines, cx_utility, batch_size=10, queue_size=2)
+
+    assert counts == {"Coles": 50, "Aldi": 30}
+    assert sorted(synced) == ["Aldi", "Coles"]
+    assert len(cx_utility.load_data("Coles")) == 50
+    assert cx_utility.get_triage("Coles", 5)
+
+
+def test_writes_hold_the_lock_of_the_fetches_of_the_handle(workdir, monkeypatch):
+    import fcntl
+
+    from cx_form_handler import SINGLE_FLIGHT
+    from cx_ingest import ingest
+    from cx_utility import TwitterUtility
+
+    cx_utility = TwitterUtility.get_instance()
+    save_data_frame = cx_utility.save_data_frame
+    locked = []
+
+    def checked_save_data_frame(user, *args, **kwargs):
+        # the fetches of the handle take this lock, see TwitterAPI.get_tweets
+        with open(f"{SINGLE_FLIGHT.lock_dir}/tweets-data_{user}.csv.lock", "a") as f_lock:
+            try:
+                fcntl.flock(f_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked.append(False)
+                fcntl.flock(f_lock, fcntl.LOCK_UN)
+            except BlockingIOError:
+                locked.append(True)
+        return save_data_frame(user, *args, **kwargs)
+
+    monkeypatch.setattr(cx_utility, "save_data_frame", checked_save_data_frame)
+    ingest(tweet_lines("Coles", 20), cx_utility, batch_size=10)
+
+    assert locked == [True, True]
+
+
+def test_buffered_stops_when_the_caller_stops(workdir):
+    import threading
+
+    from cx_ingest import buffered
+
+    closed = threading.Event()
+
+    def numbers():
+        try:
+            number = 0
+            while True:
+                yield number
+                number += 1
+        finally:
+            closed.set()
+
+    items = buffered(numbers(), 2)
+    assert [next(items) for _ in range(3)] == [0, 1, 2]
+    items.close()
+
+    assert closed.wait(5)
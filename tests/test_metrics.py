@@ -0,0 +1,40 @@
+"""
+Tests of the timers and counters.
+"""
+import time
+
+from conftest import FakeTweet
+from cx_metrics import STAGE_SECONDS
+
+
+def stage_seconds(stage):
+    """
+    Returns the time observed for a stage so far.
+    """
+    entry = STAGE_SECONDS.values.get((("stage", stage),))
+    return 0.0 if entry is None else entry[1]
+
+
+def test_save_stage_does_not_time_the_scoring(workdir, monkeypatch):
+    from cx_utility import TwitterUtility
+
+    cx_utility = TwitterUtility.get_instance()
+    tweets_to_data_frame = cx_utility.tweets_to_data_frame
+
+    def slow_tweets_to_data_frame(tweets):
+        time.sleep(0.5)
+        return tweets_to_data_frame(tweets)
+
+    monkeypatch.setattr(cx_utility, "tweets_to_data_frame", slow_tweets_to_data_frame)
+    save = stage_seconds("save")
+    cx_utility.save_data("Coles", [FakeTweet("Coles", number) for number in range(20)])
+
+    assert 0 < stage_seconds("save") - save < 0.5
+    assert cx_utility.has_data("Coles")
+
+
+def test_metrics_are_rendered(client):
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert b"# TYPE cx_stage_seconds histogram" in response.data
@@ -0,0 +1,41 @@
+"""
+Tests of the plots and their cache.
+"""
+import pytest
+
+
+@pytest.fixture
+def stored(client):
+    """
+    Fetches and stores the tweets of two twitter handles.
+    """
+    from cx_form_handler import TwitterAPI
+
+    api = TwitterAPI.get_instance()
+    for handle in ("Coles", "woolworths"):
+        api.get_tweets(handle)
+    return client
+
+
+@pytest.mark.parametrize("first, second", [
+    ("/display/Coles/woolworths", "/compare/Coles,woolworths"),
+    ("/compare/Coles,woolworths", "/display/Coles/woolworths"),
+])
+def test_pair_and_handles_plots_are_cached_apart(stored, first, second):
+    for url in (first, second, first):
+        response = stored.get(url + "?stream=0")
+        assert response.status_code == 200
+        assert b"There is no data available" not in response.data
+
+
+def test_handles_removed_before_they_are_loaded_show_the_error_page(stored, monkeypatch):
+    from cx_utility import TwitterUtility
+
+    def load_data(user, columns=None):
+        raise FileNotFoundError(f"data/{user}.csv")
+
+    monkeypatch.setattr(TwitterUtility.get_instance(), "load_data", load_data)
+    response = stored.get("/compare/Coles,woolworths")
+
+    assert response.status_code == 200
+    assert b"There is no data available for one of the twitter handles" in response.data
@@ -0,0 +1,91 @@
+"""
+Tests of the rate limit budgets shared by the processes of the app.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import cx_rate_limit
+from cx_rate_limit import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    A clock of the rate limiter that only moves when told to.
+    """
+    now = SimpleNamespace(value=1000000.0)
+    monkeypatch.setattr(cx_rate_limit, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_an_empty_bucket_is_refilled_over_time(workdir, clock):
+    limiter = RateLimiter({"test": (2, 10)}, "data/rate_limit.db")
+
+    assert limiter.acquire("test") == 0
+    assert limiter.acquire("test") == 0
+    assert limiter.acquire("test") == pytest.approx(5)
+    assert limiter.status()["test"][0] == pytest.approx(0)
+
+    clock.value += 5
+    assert limiter.acquire("test") == 0
+    assert limiter.acquire("test") == pytest.approx(5)
+
+    clock.value += 60
+    assert limiter.status()["test"][0] == pytest.approx(2)
+    assert limiter.acquire("test", 2) == 0
+
+
+def test_a_limit_of_zero_turns_the_budget_off(workdir, clock):
+    limiter = RateLimiter({"test": (0, 10)}, "data/rate_limit.db")
+
+    assert all(limiter.acquire("test") == 0 for _ in range(10))
+
+
+def test_limiters_on_the_same_file_share_the_budget(workdir, clock):
+    first = RateLimiter({"test": (3, 30)}, "data/rate_limit.db")
+    second = RateLimiter({"test": (3, 30)}, "data/rate_limit.db")
+
+    assert first.acquire("test") == 0
+    assert second.acquire("test") == 0
+    assert first.acquire("test") == 0
+    assert second.acquire("test") == pytest.approx(10)
+    assert first.status()["test"][0] == pytest.approx(0)
+
+
+@pytest.fixture
+def limited(workdir, fake_twitter, monkeypatch):
+    """
+    A client of the app with a budget of one page view a minute and
+    the tweets of two twitter handles stored.
+    """
+    monkeypatch.setenv("PAGE_VIEW_RATE_LIMIT", "1")
+    monkeypatch.setenv("PAGE_VIEW_RATE_WINDOW_SECONDS", "60")
+
+    import cx_flask
+    from cx_form_handler import TwitterAPI
+
+    api = TwitterAPI.get_instance()
+    for handle in ("Coles", "woolworths"):
+        api.get_tweets(handle)
+
+    app = cx_flask.create_app(preload_modules=False)
+    app.testing = True
+    return app.test_client()
+
+
+def test_display_responds_429_with_retry_after(limited):
+    assert limited.get("/display/Coles/woolworths?stream=0").status_code == 200
+
+    response = limited.get("/display/Coles/woolworths?stream=0")
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
+
+
+def test_api_takes_from_the_page_view_budget(limited):
+    assert limited.get("/api/tweets/Coles").status_code == 200
+
+    response = limited.get("/api/triage/Coles")
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
+    assert "error" in response.get_json()
@@ -0,0 +1,113 @@
+"""
+Tests of the storage formats of the tweets.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from cx_storage import STORES, SqliteStore
+
+
+def tweets(numbers, sentiment=0.5, first_id=1300000000000000000):
+    # newest first, as the API returns them
+    numbers = sorted(numbers, reverse=True)
+    return pd.DataFrame({
+        "tweets": [f"tweet {number}" for number in numbers],
+        "id": [first_id + number for number in numbers],
+        "date": [pd.Timestamp("2020-01-01") + pd.Timedelta(days=number) for number in numbers],
+        "source": ["Twitter Web App"] * len(numbers),
+        "likes": list(numbers),
+        "sentiment": [sentiment] * len(numbers),
+    })
+
+
+@pytest.fixture(params=sorted(STORES))
+def store(request, workdir):
+    if request.param in ("feather", "parquet"):
+        pytest.importorskip("pyarrow")
+    return STORES[request.param]()
+
+
+def test_round_trip(store):
+    store.write("Coles", tweets([1, 2, 3]))
+
+    assert store.exists("Coles")
+    # the sqlite store keeps the handles in lower case
+    assert store.users() == ["coles" if store.name == "sqlite" else "Coles"]
+    df_tweets = store.read("Coles")
+    assert list(df_tweets["id"]) == [1300000000000000003, 1300000000000000002, 1300000000000000001]
+    assert list(df_tweets["date"]) == [pd.Timestamp("2020-01-04"), pd.Timestamp("2020-01-03"),
+                                       pd.Timestamp("2020-01-02")]
+    assert list(store.read("Coles", ["id", "likes"]).columns) == ["id", "likes"]
+
+    store.remove("Coles")
+    assert not store.exists("Coles")
+    with pytest.raises(FileNotFoundError):
+        store.read("Coles")
+
+
+def test_merge_replaces_tweets_by_id(store):
+    store.write("Coles", tweets([1, 2, 3]))
+    version = store.version("Coles")
+    store.merge("Coles", tweets([3, 4], sentiment=-0.5))
+
+    df_tweets = store.read("Coles")
+    assert list(df_tweets["id"] - 1300000000000000000) == [4, 3, 2, 1]
+    assert list(df_tweets["sentiment"]) == [-0.5, -0.5, 0.5, 0.5]
+    assert store.version("Coles") != version
+
+
+def test_merge_keeps_the_retention(store):
+    store.write("Coles", tweets([1, 2, 3]))
+    store.merge("Coles", tweets([10]), retention_days=7)
+    assert list(store.read("Coles")["id"] - 1300000000000000000) == [10, 3]
+
+    store.merge("Coles", tweets([11]), retention_count=1)
+    assert list(store.read("Coles")["id"] - 1300000000000000000) == [11]
+
+
+def test_sqlite_store_is_case_insensitive(workdir):
+    store = SqliteStore()
+    store.write("Coles", tweets([1, 2]))
+    store.merge("COLES", tweets([3]))
+
+    assert store.exists("coles")
+    assert store.users() == ["coles"]
+    assert len(store.read("cOLES")) == 3
+
+
+def test_sqlite_store_queries_several_handles(workdir):
+    store = SqliteStore()
+    store.write("Coles", tweets([1, 2, 3]))
+    # tweet ids are unique across twitter handles
+    store.write("woolworths", tweets([2, 3], -0.5, 1400000000000000000))
+    store.write("aldi", tweets([1], first_id=1500000000000000000))
+
+    df_tweets = store.query(
+        ["COLES", "Woolworths"],
+        since=pd.Timestamp("2020-01-03"),
+        until=pd.Timestamp("2020-01-04"),
+        columns=["id", "sentiment"],
+    )
+    assert list(df_tweets.columns) == ["handle", "id", "sentiment"]
+    assert sorted(df_tweets["handle"]) == ["coles", "woolworths"]
+
+    df_negative = store.query(max_sentiment=0)
+    assert set(df_negative["handle"]) == {"woolworths"}
+    assert len(df_negative) == 2
+
+    summary = store.summary(["coles", "woolworths"])
+    assert list(summary["handle"]) == ["coles", "woolworths"]
+    assert list(summary["tweets"]) == [3, 2]
+    assert list(summary["negative"]) == [0, 2]
+    assert list(summary["sentiment"]) == [0.5, -0.5]
+    assert list(summary["latest"]) == [pd.Timestamp("2020-01-04")] * 2
+
+
+def test_sqlite_store_is_not_in_the_data_budget(workdir):
+    store = SqliteStore()
+    assert store.cache_manager is None
+    store.write("Coles", tweets([1]))
+    store.record_access("Coles")
+    assert os.path.isfile("data/tweets.db")
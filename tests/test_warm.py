@@ -0,0 +1,30 @@
+"""
+Tests of the warm up of the cache.
+"""
+import sys
+
+from cx_utility import CustomerExperienceException
+
+
+def test_a_failed_handle_does_not_stop_the_warm_up(workdir, fake_twitter, monkeypatch, capsys):
+    import cx_warm
+    from cx_form_handler import TwitterAPI
+
+    download_tweets = TwitterAPI.download_tweets
+
+    def failing_download_tweets(self, user):
+        if user == "broken":
+            raise CustomerExperienceException("Failed to send request")
+        return download_tweets(self, user)
+
+    monkeypatch.setattr(TwitterAPI, "download_tweets", failing_download_tweets)
+    workdir.joinpath("handles.csv").write_text("broken\nColes,1600000000\n")
+    monkeypatch.setattr(sys, "argv", ["cx_warm.py", "--handles", "handles.csv", "--workers", "1"])
+
+    cx_warm.main()
+
+    output = capsys.readouterr().out
+    assert "broken: failed - Failed to send request" in output
+    assert "Coles: 50 tweets" in output
+    assert "Warmed 1 twitter handles with 50 tweets" in output
+    assert "1 failed" in output